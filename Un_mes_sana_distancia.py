@@ -23,6 +23,15 @@ import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
 import seaborn as sns
 
+from estimacion_rt import EstimacionRt, IndiceRt, IntervaloSerial, MatrizIncidencia
+from escenarios_ranking import BarridoRanking, EstabilidadRanking, IndicadoresEstados, RazonesCrecimiento, RejillaUmbrales
+from intervalos_confianza import IntervalosProporcion, IntervalosTasa
+from estratificacion import Marginal
+from lectura_casos import LeerCasos
+from modelo_riesgo import AjustarModelo, BloquesZip, RazonesMomios
+from agregados import CalcularAgregados, TensorCasos
+from exportar_sqlite import Conectar, ExportarAgregados
+
 locale.setlocale(locale.LC_ALL, 'es-mx')
 sns.set()
 sns.set_style('white')
@@ -46,8 +55,11 @@ with open(nombre, 'wb') as archivo:
 # In[3]:
 
 
-casos_totales = pd.read_csv(nombre, encoding='latin-1')
+# 'pandas' lee con pd.read_csv; 'arrow' usa el lector multihilo de pyarrow con los tipos del diccionario de datos
+motor_lectura = 'pandas'
+
 diccionario = pd.read_excel('Descriptores_0419.xlsx', encoding='utf-8')
+casos_totales = LeerCasos(nombre, diccionario, motor=motor_lectura)
 
 
 # Se crea un diccionario con los nombres de las entidades federativas a partir del archivo de catálogos de los datos abiertos.
@@ -218,6 +230,14 @@ casos_pendientes = casos_totales[casos_totales['RESULTADO'] == 3]
 defunciones = casos_totales.dropna(subset=['FECHA_DEF'])
 
 
+# Se construye también un tensor con el número de casos en cada combinación de grupo de edad, sexo, entidad, resultado, tipo de paciente, intubación, institución, contacto con otros casos, habla indígena, nacionalidad y defunción. Los valores fuera de catálogo se cuentan en la categoría 'Otros' de cada eje, de modo que ningún registro queda fuera de los totales. Como la mayoría de las combinaciones no tiene casos, el tensor se guarda en forma dispersa. Las distribuciones que se presentan más adelante son sumas de este tensor.
+
+# In[ ]:
+
+
+conteos, etiquetas_conteos = TensorCasos(casos_totales)
+
+
 # ### Distribución del total de casos estudiados
 # Al 29 de abril de 2020, existen 17,799 casos confirmados, 50,849 casos que resultaron negativos y 13,263 con resultados de prueba pendientes. A la fecha, 1 de cada 4 pruebas realizadas tuvieron resultado positivo.
 
@@ -225,7 +245,7 @@ defunciones = casos_totales.dropna(subset=['FECHA_DEF'])
 
 
 etiquetas = ['Positivos', 'Negativos', 'Pendientes']
-valores = [len(casos_confirmados), len(casos_negativos), len(casos_pendientes)]
+valores = list(Marginal(conteos, etiquetas_conteos, 'RESULTADO')[[1, 2, 3]])
 explode = (0, 0, 0.2)
 
 def funcion(porcentaje, valores):
@@ -251,10 +271,10 @@ plt.show()
 # In[19]:
 
 
-x = casos_confirmados['SECTOR'].value_counts()
+x = Marginal(conteos, etiquetas_conteos, 'SECTOR', {'RESULTADO': 1}).sort_values(ascending=False)
 sns.set_palette('Set3',n_colors=10)
 
-etiquetas = [instituciones[i] for i in x.index[:5]] + ['OTROS']
+etiquetas = [instituciones.get(i, i) for i in x.index[:5]] + ['OTROS']
 valores = np.append(x.values[:5], x.sum() - x.values[:5].sum())
 
 def funcion(porcentaje, valores):
@@ -278,9 +298,10 @@ plt.show()
 # In[20]:
 
 
-ambulatorios = len(casos_confirmados[casos_confirmados['TIPO_PACIENTE']==1])
-hospitalizados = len(casos_confirmados[casos_confirmados['TIPO_PACIENTE']==2])
-intubados = len(casos_confirmados[casos_confirmados['INTUBADO']==1])
+atencion = Marginal(conteos, etiquetas_conteos, 'TIPO_PACIENTE', {'RESULTADO': 1})
+ambulatorios = atencion[1]
+hospitalizados = atencion[2]
+intubados = Marginal(conteos, etiquetas_conteos, 'INTUBADO', {'RESULTADO': 1})[1]
 
 etiquetas = ['Ambulatorios', 'Hospitalizados', 'Intubados']
 valores = [ambulatorios, hospitalizados - intubados, intubados]
@@ -307,8 +328,9 @@ plt.show()
 # In[21]:
 
 
-con_contacto = len(casos_confirmados[casos_confirmados['OTRO_CASO']==1])
-sin_contacto = len(casos_confirmados[casos_confirmados['OTRO_CASO']==2])
+contacto = Marginal(conteos, etiquetas_conteos, 'OTRO_CASO', {'RESULTADO': 1})
+con_contacto = contacto[1]
+sin_contacto = contacto[2]
 
 etiquetas = ['Contacto con otro caso', 'Sin contacto']
 valores = [con_contacto, sin_contacto]
@@ -417,7 +439,8 @@ ax.legend(loc='upper left', frameon=False)
 
 matriz_estados = pd.DataFrame(index=list(entidades.values())[:32],
                               columns=['Lugar en casos','Incidencia','Letalidad','Tendencia'])
-x = casos_confirmados['ENTIDAD_UM'].value_counts()
+x = Marginal(conteos, etiquetas_conteos, 'ENTIDAD_UM', {'RESULTADO': 1})
+x = x[x > 0].sort_values(ascending=False)
 
 # Asigna indicador de lugar en número de casos
 c = 0
@@ -523,6 +546,52 @@ print('Entidades letalidad media:', len(entidades_media_letalidad))
 print('Entidades baja letalidad:', len(entidades_baja_letalidad))
 
 
+# Para los estados con pocos casos la letalidad observada es muy incierta. Se calculan intervalos de confianza exactos del 95% (Clopper-Pearson) para la letalidad de cada entidad, que a diferencia del bootstrap no se degeneran en las entidades con pocos casos o sin defunciones.
+
+# In[ ]:
+
+
+confirmados_entidad = casos_confirmados['ENTIDAD_UM'].value_counts()
+defunciones_entidad = defunciones[defunciones['RESULTADO'] == 1]['ENTIDAD_UM'].value_counts()
+
+intervalos_letalidad = IntervalosProporcion(defunciones_entidad.reindex(confirmados_entidad.index, fill_value=0),
+                                            confirmados_entidad)
+intervalos_letalidad.sort_values(by='Estimacion', ascending=False, inplace=True)
+errores = [intervalos_letalidad['Estimacion'] - intervalos_letalidad['Inferior'],
+           intervalos_letalidad['Superior'] - intervalos_letalidad['Estimacion']]
+
+fig, ax = plt.subplots(constrained_layout=True, figsize=(12,6))
+ax.set_title('Indice de letalidad e intervalo de confianza del 95%\nen cada entidad federativa', fontsize=24)
+ax.set_xlabel('Defunciones entre casos confirmados', fontsize=16)
+ax.barh([entidades[i] for i in intervalos_letalidad.index], intervalos_letalidad['Estimacion'],
+        xerr=errores, color='lightgray', ecolor='dimgray')
+ax.axvline(letalidad_mundial, color='salmon')
+ax.axvline(letalidad_mundial * 2, color='salmon', linestyle='--')
+ax.invert_yaxis()
+ax.grid(axis='x', color='dodgerblue')
+
+
+# Con los mismos datos se calcula el intervalo exacto del 95% (Poisson de Garwood) para la incidencia por millón de habitantes, junto a los umbrales de 50 y 200 casos por millón con los que se asigna el indicador de incidencia.
+
+# In[ ]:
+
+
+intervalos_incidencia = IntervalosTasa(confirmados_entidad, confirmados_entidad.index.map(poblacion_entidades))
+intervalos_incidencia.sort_values(by='Estimacion', ascending=False, inplace=True)
+errores = [intervalos_incidencia['Estimacion'] - intervalos_incidencia['Inferior'],
+           intervalos_incidencia['Superior'] - intervalos_incidencia['Estimacion']]
+
+fig, ax = plt.subplots(constrained_layout=True, figsize=(12,6))
+ax.set_title('Incidencia por millón de habitantes e intervalo de confianza del 95%\nen cada entidad federativa', fontsize=24)
+ax.set_xlabel('Confirmados por millón de habitantes', fontsize=16)
+ax.barh([entidades[i] for i in intervalos_incidencia.index], intervalos_incidencia['Estimacion'],
+        xerr=errores, color='lightgray', ecolor='dimgray')
+ax.axvline(50, color='salmon')
+ax.axvline(200, color='salmon', linestyle='--')
+ax.invert_yaxis()
+ax.grid(axis='x', color='dodgerblue')
+
+
 # ### Tendencias por entidad federativa
 # De los seis estados con alta incidencia, la ciudad de México muestra un crecimiento importante del promedio móvil de 7 días de casos confirmados por fecha de inicio de síntomas. Baja California y Baja California Sur presentan una reducción, en tanto que Quintana Roo, Sinaloa y Tabasco muestran cierta desaceleración.
 
@@ -543,40 +612,18 @@ def IndiceCrecimiento(valores):
         0. Baja importante. Reducción de más de 50% respecto al promedio móvil
            máximo (Se reduce a la mitad en menos de 14 días)."""
     
-    ultima_fecha = min(datetime.date(valores.index[-1]), fecha_actualizacion - timedelta(days=-desfase))
-    if ultima_fecha not in valores.index:
-        for indice in valores.index:
-            if indice < ultima_fecha:
-                siguiente = indice
-            else:
-                break
-        ultima_fecha = datetime.date(siguiente)
-    vector = valores.dropna()[:ultima_fecha]
-    referencia = vector[ultima_fecha]
-        
-    if (ultima_fecha - datetime.date(vector.index[0])) < timedelta(days=14):
-        periodo = datetime.date(vector.index[0])
-    else:
-        if (ultima_fecha - timedelta(days=14)) not in vector.index:
-            for indice in vector.index:
-                if indice < (ultima_fecha - timedelta(days=14)):
-                    siguiente = indice
-                else:
-                    break
-            periodo = datetime.date(siguiente)
-        else:
-            periodo = ultima_fecha - timedelta(days=14)
-    if referencia == vector.max():
-        if referencia / vector[periodo] > 2:
+    razon_periodo, razon_maximo = RazonesCrecimiento(valores, fecha_actualizacion - timedelta(days=-desfase))
+    if razon_maximo == 1:
+        if razon_periodo > 2:
             indice = 4
-        elif referencia / vector[periodo] > 1.41:
+        elif razon_periodo > 1.41:
             indice = 3
         else:
             indice = 2
     else:
-        if referencia / vector.max() < 0.5:
+        if razon_maximo < 0.5:
             indice = 0
-        elif referencia / vector.max() < 0.71:
+        elif razon_maximo < 0.71:
             indice = 1
         else:
             indice = 2
@@ -664,15 +711,42 @@ ax.grid('True')
 plt.show()
 
 
+# ### Número reproductivo efectivo por entidad federativa
+# Como alternativa al indicador de tendencia del promedio móvil, se estima el número reproductivo efectivo (Rt) de cada entidad con el método de Cori et al. (2013), usando un intervalo serial gamma con media de 4.7 días y desviación estándar de 2.9 días (Nishiura et al., 2020). El indicador sólo marca alza o baja cuando el intervalo de credibilidad del 95% excluye a 1.
+
+# In[ ]:
+
+
+incidencia_estados = MatrizIncidencia(casos_confirmados, 'ENTIDAD_UM', 'FECHA_SINTOMAS')
+rt_media, rt_inferior, rt_superior = EstimacionRt(incidencia_estados, IntervaloSerial(4.7, 2.9), ventana=7)
+
+# Último valor de Rt antes del desfase por retraso en la confirmación de casos
+corte = pd.Timestamp(fecha_actualizacion - timedelta(days=-desfase))
+rt_estados = pd.DataFrame({'Rt': rt_media.loc[:, :corte].iloc[:, -1],
+                           'Inferior': rt_inferior.loc[:, :corte].iloc[:, -1],
+                           'Superior': rt_superior.loc[:, :corte].iloc[:, -1]})
+rt_estados['Tendencia Rt'] = IndiceRt(rt_estados['Rt'], rt_estados['Inferior'], rt_estados['Superior'], 4.7)
+rt_estados.rename(index=entidades, inplace=True)
+
+matriz_estados['Tendencia Rt'] = rt_estados['Tendencia Rt']
+
+# Indicador de tendencia que se usa en el ranking ('Tendencia' o 'Tendencia Rt'). Las entidades
+# en las que no se pudo estimar Rt conservan el indicador 'Tendencia'
+columna_tendencia = 'Tendencia'
+
+rt_estados.sort_values(by='Rt', ascending=False)
+
+
 # In[35]:
 
 
-matriz_estados['Ranking'] = matriz_estados['Lugar en casos'] / matriz_estados['Lugar en casos'].max() +                            matriz_estados['Incidencia'] + matriz_estados['Letalidad'] + matriz_estados['Tendencia']
+matriz_estados['Ranking'] = matriz_estados['Lugar en casos'] / matriz_estados['Lugar en casos'].max() +                            matriz_estados['Incidencia'] + matriz_estados['Letalidad'] + matriz_estados[columna_tendencia].fillna(matriz_estados['Tendencia'])
 matriz_estados.sort_values(by='Ranking', ascending=False, inplace=True)
 matriz_estados['Lugar en casos'] = 33 - matriz_estados['Lugar en casos']
 matriz_estados['Incidencia'].replace({2:'Alta',1:'Media',0:'Baja'}, inplace=True)
 matriz_estados['Letalidad'].replace({2:'Alta',1:'Media',0:'Baja'}, inplace=True)
-matriz_estados['Tendencia'].replace({4:'Alza importante', 3:'Alza moderada',
+for columna in ['Tendencia', 'Tendencia Rt']:
+    matriz_estados[columna].replace({4:'Alza importante', 3:'Alza moderada',
                                      2:'Estable', 1:'Baja moderada', 0:'Baja importante'}, inplace=True)
 
 
@@ -684,6 +758,27 @@ matriz_estados['Tendencia'].replace({4:'Alza importante', 3:'Alza moderada',
 matriz_estados.drop(['Ranking'], axis=1)
 
 
+# ### Sensibilidad del ranking a los umbrales
+# Los indicadores de la matriz dependen de umbrales fijos: 50 y 200 casos por millón para la incidencia, 1 y 2 veces la letalidad mundial, y las razones de 2, 1.41, 0.71 y 0.5 para la tendencia. Para ver qué tanto depende el ranking de esos valores, se evalúa para una rejilla de combinaciones de umbrales y se mide qué tan estable es el lugar de cada entidad.
+
+# In[ ]:
+
+
+indicadores_estados = IndicadoresEstados(casos_confirmados, defunciones[defunciones['RESULTADO'] == 1], poblacion_entidades,
+                                         fecha_actualizacion - timedelta(days=-desfase)).rename(index=entidades)
+
+rejilla = RejillaUmbrales(incidencia_media=[25, 50, 75, 100], incidencia_alta=[150, 200, 250, 300],
+                          letalidad_media=letalidad_mundial * np.array([0.75, 1, 1.25]),
+                          letalidad_alta=letalidad_mundial * np.array([1.5, 2, 2.5]),
+                          alza_importante=[1.75, 2, 2.25], alza_moderada=[1.2, 1.41, 1.6],
+                          baja_moderada=[0.6, 0.71, 0.8], baja_importante=[0.4, 0.5])
+lugares = BarridoRanking(indicadores_estados, rejilla)
+lugares_base = BarridoRanking(indicadores_estados, RejillaUmbrales()).iloc[0]
+
+print('Escenarios evaluados:', len(rejilla))
+EstabilidadRanking(lugares, lugares_base)
+
+
 # ## Análisis atributos sociodemográficos
 # Se fijan los valores de referencia de distribución de la población con datos del conteo intercensal 2015 del INEGI.
 # 
@@ -703,7 +798,8 @@ poblacion_por_sexo = [48.6, 51.4]
 
 
 n = 2
-valores = casos_confirmados['SEXO'].value_counts().values / len(casos_confirmados)
+sexo = Marginal(conteos, etiquetas_conteos, 'SEXO', {'RESULTADO': 1})
+valores = sexo[['Hombres', 'Mujeres']].values / sexo.sum()
 
 ind = np.arange(n)
 ancho = 0.35
@@ -729,10 +825,7 @@ plt.show()
 # In[39]:
 
 
-distribucion_edad = pd.cut(casos_confirmados['EDAD'], bins=[0] + [9 + i*10 for i in range(0,9)]).value_counts(sort=False)
-indices = list(distribucion_edad.index)
-distribucion_edad[indices[0]] += len(casos_confirmados[casos_confirmados['EDAD'] == 0])
-distribucion_edad[indices[-1]] += len(casos_confirmados[casos_confirmados['EDAD'] > 89])
+distribucion_edad = Marginal(conteos, etiquetas_conteos, 'EDAD', {'RESULTADO': 1}).drop('Otros')
 
 n = len(distribucion_edad)
 valores = distribucion_edad.values / distribucion_edad.sum()
@@ -747,7 +840,7 @@ rects2 = ax.bar(ind + ancho, np.array(poblacion_por_edad) / 100, ancho, color='y
 ax.set_ylabel('Porcentaje', fontsize=16)
 ax.set_title('Distribución por edad\nal '+ fecha_actualizacion.strftime('%d de %B del %Y'),fontsize=20)
 ax.set_xticks(ind + ancho / 2)
-ax.set_xticklabels(['0-19','10-19','20-29','30-39','40-49','50-59','60-69','70-79', '80+'], fontsize=14)
+ax.set_xticklabels(distribucion_edad.index, fontsize=14)
 
 ax.legend((rects1[0],rects2[0]),('Casos confirmados', 'Población'))
 
@@ -761,7 +854,7 @@ plt.show()
 
 
 etiquetas = ['Sí habla lengua indígena', 'No habla lengua indígena']
-valores = [(casos_confirmados['HABLA_LENGUA_INDIG'] == 1).sum(), (casos_confirmados['HABLA_LENGUA_INDIG'] == 2).sum()]
+valores = list(Marginal(conteos, etiquetas_conteos, 'HABLA_LENGUA_INDIG', {'RESULTADO': 1})[[1, 2]])
 
 explode = (0, 0)
 
@@ -787,7 +880,7 @@ plt.show()
 
 
 etiquetas = ['Mexicana', 'Extranjera']
-valores = [(casos_confirmados['NACIONALIDAD'] == 1).sum(), (casos_confirmados['NACIONALIDAD'] == 2).sum()]
+valores = list(Marginal(conteos, etiquetas_conteos, 'NACIONALIDAD', {'RESULTADO': 1})[[1, 2]])
 
 explode = (0, 0)
 
@@ -857,6 +950,57 @@ for lista in lista_atributos:
     plt.show()
 
 
+# La prevalencia de cada comorbilidad entre los casos confirmados varía entre entidades. Se calcula con su intervalo exacto del 95% considerando sólo los registros en los que se conoce el dato.
+
+# In[ ]:
+
+
+prevalencia_entidades = {}
+for atributo in lista_atributos[0] + lista_atributos[1]:
+    registrados = casos_confirmados[casos_confirmados[atributo].isin([1, 2])]
+    prevalencia_entidades[atributo] = IntervalosProporcion((registrados[atributo] == 1).groupby(registrados['ENTIDAD_UM']).sum(),
+                                                           registrados['ENTIDAD_UM'].value_counts())
+prevalencia_entidades = pd.concat(prevalencia_entidades, axis=1).rename(index=entidades)
+prevalencia_entidades
+
+
+# Las gráficas anteriores muestran la prevalencia de cada comorbilidad, pero no separan su efecto del de la edad o el sexo. Para ello se ajusta un modelo logístico de defunción y otro de intubación entre los casos confirmados, con edad, sexo, comorbilidades, sector y entidad de atención como variables explicativas, y se presentan las razones de momios ajustadas de cada comorbilidad. La base se lee por bloques, de modo que el ajuste funciona también con versiones de la base mucho más grandes.
+
+# In[ ]:
+
+
+modelo_defuncion = AjustarModelo(BloquesZip(nombre), objetivo='DEFUNCION')
+modelo_intubacion = AjustarModelo(BloquesZip(nombre), objetivo='INTUBADO')
+razones_momios = RazonesMomios(modelo_defuncion).loc[atributos_comorbilidad].sort_values(by='Razon de momios')
+
+fig, ax = plt.subplots(constrained_layout=True, figsize=(12,6))
+ax.set_title('Razón de momios ajustada de defunción\npor comorbilidad', fontsize=24)
+ax.set_xlabel('Razón de momios (intervalo de confianza del 95%)', fontsize=16)
+ax.errorbar(razones_momios['Razon de momios'], razones_momios.index,
+            xerr=[razones_momios['Razon de momios'] - razones_momios['Inferior'],
+                  razones_momios['Superior'] - razones_momios['Razon de momios']],
+            fmt='o', color='salmon', ecolor='dimgray', capsize=4)
+ax.axvline(1, color='dodgerblue')
+ax.set_xscale('log')
+ax.grid(axis='x')
+
+plt.show()
+
+pd.concat({'Defunción': RazonesMomios(modelo_defuncion).loc[atributos_comorbilidad],
+           'Intubación': RazonesMomios(modelo_intubacion).loc[atributos_comorbilidad]}, axis=1)
+
+
+# Los agregados de esta versión de la base se guardan en una base SQLite, junto con los de las versiones anteriores, para poder consultar su evolución sin volver a ejecutar el análisis.
+
+# In[ ]:
+
+
+agregados = CalcularAgregados(casos_totales, entidades, poblacion_entidades, fecha_actualizacion, desfase, instituciones)
+conexion = Conectar('agregados_covid19.sqlite')
+ExportarAgregados(conexion, fecha_actualizacion.isoformat(), agregados, len(casos_totales))
+conexion.close()
+
+
 # ## Conclusiones
 # A un mes de la implantación de las medidas de distanciamiento social, no hay señales de que pueda haber pronto una reanudación generalizada de actividades en México. A nivel nacional sigue creciendo el número de casos nuevos por día que ingresan al sistema de salud, aunque parece haber cierta desaceleración en el número de casos por fecha de inicio de síntomas a partir del 16 de abril.
 # 
@@ -0,0 +1,199 @@
+# coding: utf-8
+""" Agregados del análisis de casos estudiados de COVID-19.
+
+    Reúne en funciones los totales, distribuciones de las gráficas, series
+    diarias, casos por entidad, matriz de indicadores por entidad y tablas de
+    comorbilidad que se presentan en
+    Un_mes_sana_distancia, para que puedan calcularse sin ejecutar el notebook
+    a partir de cualquier versión de la base."""
+
+from datetime import timedelta
+
+import pandas as pd
+
+from estratificacion import Marginal, TensorConteos
+from escenarios_ranking import IndicadoresEstados, IndicadoresRanking, RejillaUmbrales
+
+columnas_fecha = ['FECHA_INGRESO', 'FECHA_SINTOMAS', 'FECHA_DEF']
+atributos_comorbilidad = ['NEUMONIA', 'DIABETES', 'HIPERTENSION', 'CARDIOVASCULAR', 'OBESIDAD', 'TABAQUISMO',
+                          'RENAL_CRONICA', 'EMBARAZO', 'EPOC', 'ASMA', 'INMUSUPR', 'OTRAS_COM']
+
+# Ejes del tensor de conteos de casos; los valores fuera de catálogo se cuentan en 'Otros'
+ejes_casos = {'EDAD': {'bordes': [0, 10, 20, 30, 40, 50, 60, 70, 80], 'otros': 'Otros'},
+              'SEXO': {'categorias': [2, 1], 'etiquetas': ['Hombres', 'Mujeres'], 'otros': 'Otros'},
+              'ENTIDAD_UM': {'categorias': list(range(1, 33)), 'otros': 'Otros'},
+              'RESULTADO': {'categorias': [1, 2, 3], 'otros': 'Otros'},
+              'TIPO_PACIENTE': {'categorias': [1, 2], 'otros': 'Otros'},
+              'INTUBADO': {'categorias': [1, 2], 'otros': 'Otros'},
+              'SECTOR': {'categorias': list(range(1, 14)) + [99], 'otros': 'Otros'},
+              'OTRO_CASO': {'categorias': [1, 2], 'otros': 'Otros'},
+              'HABLA_LENGUA_INDIG': {'categorias': [1, 2], 'otros': 'Otros'},
+              'NACIONALIDAD': {'categorias': [1, 2], 'otros': 'Otros'}}
+
+# Claves para homologar la población del CONAPO con el catálogo de entidades
+claves = [1,2,3,4,7,8,9,5,6,10,11,12,13,14,16,17,15,18,19,20,21,22,23,36,24,25,26,27,28,29,30,31,32]
+
+
+def Entidades(ruta='Catalogos_0412.xlsx'):
+    """ Diccionario de clave de entidad a nombre, del catálogo de datos abiertos."""
+
+    catalogo_entidades = pd.read_excel(ruta, sheet_name='Catálogo de ENTIDADES')
+    return dict(zip(catalogo_entidades['CLAVE_ENTIDAD'], catalogo_entidades['ENTIDAD_FEDERATIVA']))
+
+
+def Instituciones(ruta='Catalogos_0412.xlsx'):
+    """ Diccionario de clave de sector a nombre de la institución."""
+
+    catalogo_instituciones = pd.read_excel(ruta, sheet_name='Catálogo SECTOR')
+    return dict(zip(catalogo_instituciones['CLAVE'], catalogo_instituciones['DESCRIPCIÓN']))
+
+
+def PoblacionEntidades(ruta='pob_ini_proyecciones.csv', año=2020):
+    """ Diccionario de clave de entidad a población estimada por el CONAPO."""
+
+    poblacion_entidades = pd.read_csv(ruta, encoding='utf-8')
+    poblacion_entidades = poblacion_entidades[poblacion_entidades['AÑO'] == año] \
+                          .groupby(poblacion_entidades['ENTIDAD'])['POBLACION'].sum()
+    return dict(zip(claves, poblacion_entidades))
+
+
+def PrepararCasos(casos_totales):
+    """ Aplica a la base la misma limpieza que el análisis: homologa el nombre
+        de OTRA_COM con el diccionario y convierte las columnas de fecha."""
+
+    casos_totales = casos_totales.rename(columns={'OTRA_COM': 'OTRAS_COM'})
+    for columna in columnas_fecha:
+        casos_totales[columna] = pd.to_datetime(casos_totales[columna], errors='coerce', format='%Y-%m-%d')
+    return casos_totales
+
+
+def TensorCasos(casos_totales):
+    """ Tensor disperso de conteos de casos con los ejes de ejes_casos más la
+        defunción. Todas las distribuciones del análisis son marginales de
+        este tensor (ver estratificacion). Regresa el tensor y sus etiquetas."""
+
+    ejes = dict(ejes_casos, DEFUNCION={'columna': casos_totales['FECHA_DEF'].notna(), 'categorias': [False, True]})
+    return TensorConteos(casos_totales, ejes, disperso=True)
+
+
+def Totales(tensor):
+    """ Número de casos estudiados por resultado y defunciones confirmadas, a
+        partir del tensor de TensorCasos."""
+
+    conteos, etiquetas = tensor
+    resultados = Marginal(conteos, etiquetas, 'RESULTADO')[[1, 2, 3]]
+    defunciones = Marginal(conteos, etiquetas, 'DEFUNCION', {'RESULTADO': 1})[True]
+    return pd.DataFrame({'Casos': list(resultados) + [defunciones]},
+                        index=pd.Index(['Positivos', 'Negativos', 'Pendientes', 'Defunciones confirmadas'],
+                                       name='Estado'))
+
+
+def Distribuciones(tensor, instituciones=None):
+    """ Distribución de los casos confirmados que se presenta en las gráficas
+        de pastel y de barras: institución, tipo de atención, contacto con
+        otros casos, sexo, grupo de edad, habla indígena y nacionalidad, como
+        marginales del tensor de TensorCasos. Regresa una tabla con la
+        gráfica, la categoría y el número de casos."""
+
+    conteos, etiquetas = tensor
+    Confirmados = lambda eje: Marginal(conteos, etiquetas, eje, {'RESULTADO': 1})
+    atencion = Confirmados('TIPO_PACIENTE')
+    intubados = Confirmados('INTUBADO')[1]
+    sectores = Confirmados('SECTOR')
+
+    distribuciones = {
+        'Institucion': sectores[sectores > 0].sort_values(ascending=False).rename(index=instituciones or {}),
+        'Atencion': pd.Series([atencion[1], atencion[2] - intubados, intubados],
+                              index=['Ambulatorios', 'Hospitalizados', 'Intubados']),
+        'Contacto': Confirmados('OTRO_CASO')[[1, 2]].set_axis(['Contacto con otro caso', 'Sin contacto']),
+        'Sexo': Confirmados('SEXO')[['Hombres', 'Mujeres']],
+        'Edad': Confirmados('EDAD').drop('Otros'),
+        'Habla indigena': Confirmados('HABLA_LENGUA_INDIG')[[1, 2]]
+                          .set_axis(['Sí habla lengua indígena', 'No habla lengua indígena']),
+        'Nacionalidad': Confirmados('NACIONALIDAD')[[1, 2]].set_axis(['Mexicana', 'Extranjera'])}
+    return pd.concat({grafica: serie.rename(index=str) for grafica, serie in distribuciones.items()},
+                     names=['Grafica', 'Categoria']).rename('Casos').to_frame()
+
+
+def SerieDiaria(casos_totales, columna):
+    """ Casos estudiados, confirmados, hospitalizados confirmados y defunciones
+        confirmadas por día según la columna de fecha indicada."""
+
+    confirmados = casos_totales['RESULTADO'] == 1
+    grupos = {'Estudiados': casos_totales,
+              'Confirmados': casos_totales[confirmados],
+              'Hospitalizados confirmados': casos_totales[confirmados & (casos_totales['TIPO_PACIENTE'] == 2)],
+              'Defunciones confirmadas': casos_totales[confirmados & casos_totales['FECHA_DEF'].notna()]}
+    serie = pd.DataFrame({nombre: casos[columna].value_counts() for nombre, casos in grupos.items()})
+    serie = serie.fillna(0).astype(int).sort_index().asfreq('D', fill_value=0)
+    serie.index.name = columna
+    return serie
+
+
+def ConfirmadosEstados(casos_totales, entidades):
+    """ Casos confirmados por entidad y fecha de inicio de síntomas."""
+
+    confirmados = casos_totales[casos_totales['RESULTADO'] == 1]
+    confirmados_estados = confirmados.groupby(['ENTIDAD_UM', 'FECHA_SINTOMAS']).size().rename('Casos').reset_index()
+    confirmados_estados.insert(1, 'ENTIDAD', confirmados_estados['ENTIDAD_UM'].map(entidades))
+    return confirmados_estados
+
+
+def MatrizEstados(casos_totales, entidades, poblacion_entidades, fecha_corte):
+    """ Matriz de indicadores por entidad con los umbrales del análisis,
+        ordenada para empezar por los valores más negativos."""
+
+    confirmados = casos_totales[casos_totales['RESULTADO'] == 1]
+    indicadores = IndicadoresEstados(confirmados, confirmados.dropna(subset=['FECHA_DEF']),
+                                     poblacion_entidades, fecha_corte)
+    clases = IndicadoresRanking(indicadores, RejillaUmbrales())
+
+    matriz_estados = pd.DataFrame({'Lugar en casos': len(indicadores) + 1 - clases['Lugar en casos'],
+                                   'Incidencia': clases['Incidencia'][0],
+                                   'Letalidad': clases['Letalidad'][0],
+                                   'Tendencia': clases['Tendencia'][0],
+                                   'Ranking': clases['Ranking'][0],
+                                   'Casos': indicadores['Casos'],
+                                   'Casos por millon': indicadores['Incidencia'],
+                                   'Tasa de letalidad': indicadores['Letalidad']},
+                                  index=indicadores.index)
+    matriz_estados.index = matriz_estados.index.map(entidades).rename('ENTIDAD')
+    matriz_estados.sort_values(by='Ranking', ascending=False, inplace=True)
+    matriz_estados['Incidencia'] = matriz_estados['Incidencia'].map({2:'Alta',1:'Media',0:'Baja'})
+    matriz_estados['Letalidad'] = matriz_estados['Letalidad'].map({2:'Alta',1:'Media',0:'Baja'})
+    matriz_estados['Tendencia'] = matriz_estados['Tendencia'].map({4:'Alza importante', 3:'Alza moderada',
+                                                                   2:'Estable', 1:'Baja moderada', 0:'Baja importante'})
+    return matriz_estados
+
+
+def Comorbilidad(casos_totales):
+    """ Porcentaje de casos confirmados con cada comorbilidad por tipo de
+        atención, entre los casos en los que se conoce el dato."""
+
+    confirmados = casos_totales[casos_totales['RESULTADO'] == 1]
+    grupos = {'Ambulatorios': confirmados[confirmados['TIPO_PACIENTE'] == 1],
+              'Hospitalizados': confirmados[(confirmados['TIPO_PACIENTE'] == 2) & (confirmados['INTUBADO'] != 1)],
+              'Intubados': confirmados[confirmados['INTUBADO'] == 1],
+              'Defunciones': confirmados.dropna(subset=['FECHA_DEF'])}
+    comorbilidad = pd.DataFrame({nombre: (casos[atributos_comorbilidad] == 1).sum() /
+                                         casos[atributos_comorbilidad].isin([1, 2]).sum()
+                                 for nombre, casos in grupos.items()})
+    comorbilidad.index.name = 'Comorbilidad'
+    return comorbilidad
+
+
+def CalcularAgregados(casos_totales, entidades, poblacion_entidades, fecha_actualizacion, desfase=-9,
+                      instituciones=None):
+    """ Calcula todos los agregados de una versión de la base ya preparada con
+        PrepararCasos. Regresa un diccionario de nombre a DataFrame."""
+
+    fecha_corte = fecha_actualizacion - timedelta(days=-desfase)
+    tensor = TensorCasos(casos_totales)
+    return {'totales': Totales(tensor),
+            'distribuciones': Distribuciones(tensor, instituciones),
+            'series_ingreso': SerieDiaria(casos_totales, 'FECHA_INGRESO'),
+            'series_sintomas': SerieDiaria(casos_totales, 'FECHA_SINTOMAS'),
+            'series_defuncion': SerieDiaria(casos_totales, 'FECHA_DEF'),
+            'confirmados_estados': ConfirmadosEstados(casos_totales, entidades),
+            'matriz_estados': MatrizEstados(casos_totales, entidades, poblacion_entidades, fecha_corte),
+            'comorbilidad': Comorbilidad(casos_totales)}
@@ -0,0 +1,263 @@
+# coding: utf-8
+""" Almacén columnar en disco de una versión de la base de casos estudiados.
+
+    Cada columna se guarda en un archivo .npy que se abre como memoria mapeada,
+    junto con un índice ordenado sobre ID_REGISTRO. Con ello se pueden consultar
+    registros individuales o en lote sin cargar la base completa: la búsqueda
+    binaria en el índice y la lectura de las filas sólo tocan las páginas del
+    disco que se necesitan.
+
+    Uso desde la línea de comandos:
+        python almacen_columnar.py construir datos_abiertos_covid19_29.04.2020.zip almacen
+        python almacen_columnar.py buscar almacen 09e8dc 1dd782"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+clave = 'ID_REGISTRO'
+archivo_metadatos = 'almacen.json'
+archivo_claves = '_indice_claves.npy'
+archivo_posiciones = '_indice_posiciones.npy'
+
+
+def _LeerBloques(nombre_zip, filas_por_bloque, codificacion):
+    """ Lee el CSV contenido en el ZIP por bloques, todas las columnas como texto."""
+
+    with zipfile.ZipFile(nombre_zip) as archivo_zip:
+        miembro = [m for m in archivo_zip.namelist() if m.lower().endswith('.csv')][0]
+        with archivo_zip.open(miembro) as csv:
+            yield from pd.read_csv(csv, encoding=codificacion, dtype=str, keep_default_na=False,
+                                   chunksize=filas_por_bloque)
+
+
+def _Esquema(nombre_zip, filas_por_bloque, codificacion):
+    """ Recorre el archivo una vez para determinar el número de filas y el tipo
+        de dato de cada columna: fecha (columnas FECHA_*), entero (todos los
+        valores son enteros) o texto de ancho fijo."""
+
+    filas, enteros, minimos, maximos, anchos = 0, {}, {}, {}, {}
+    for bloque in _LeerBloques(nombre_zip, filas_por_bloque, codificacion):
+        filas += len(bloque)
+        for columna in bloque.columns:
+            valores = bloque[columna]
+            anchos[columna] = max(anchos.get(columna, 1), valores.str.encode('utf-8').str.len().max())
+            es_entero = valores.str.fullmatch(r'-?\d+').all() and columna != clave
+            enteros[columna] = enteros.get(columna, True) and es_entero
+            if enteros[columna]:
+                numeros = valores.astype(np.int64)
+                minimos[columna] = min(minimos.get(columna, 0), numeros.min())
+                maximos[columna] = max(maximos.get(columna, 0), numeros.max())
+
+    tipos = {}
+    for columna in anchos:
+        if columna.startswith('FECHA_'):
+            tipos[columna] = 'datetime64[D]'
+        elif enteros[columna]:
+            tipos[columna] = np.result_type(np.min_scalar_type(minimos[columna]),
+                                            np.min_scalar_type(maximos[columna]), np.int16).str
+        else:
+            tipos[columna] = f'S{anchos[columna]}'
+    return filas, tipos
+
+
+def _Convertir(valores, tipo):
+    if tipo == 'datetime64[D]':
+        return pd.to_datetime(valores, format='%Y-%m-%d', errors='coerce').values.astype(tipo)
+    if tipo.startswith('S'):
+        return np.char.encode(valores.to_numpy(dtype=str), 'utf-8').astype(tipo)
+    return valores.astype(tipo).to_numpy()
+
+
+def ConstruirAlmacen(nombre_zip, raiz, filas_por_bloque=500000, codificacion='latin-1'):
+    """ Construye el almacén columnar de una versión de la base a partir del ZIP
+        descargado. Se crea un subdirectorio de raiz con la fecha de
+        actualización de la base, que contiene un archivo .npy por columna,
+        el índice ordenado de ID_REGISTRO y un archivo de metadatos. El CSV se
+        lee por bloques, por lo que la memoria usada no depende del tamaño de
+        la base. La codificación por omisión es la misma con la que se lee
+        el CSV en el análisis. El almacén se construye en un directorio
+        temporal propio (varias construcciones pueden correr a la vez) y se
+        pone en su lugar con un renombrado; si la versión ya existía, la
+        anterior se aparta antes y se elimina después, de modo que los
+        lectores nunca ven una versión a medio borrar (sólo entre los dos
+        renombrados la versión no aparece). Regresa la ruta del
+        subdirectorio."""
+
+    filas, tipos = _Esquema(nombre_zip, filas_por_bloque, codificacion)
+
+    os.makedirs(raiz, exist_ok=True)
+    temporal = tempfile.mkdtemp(dir=raiz, prefix='_')
+    os.chmod(temporal, 0o755)
+    try:
+        fecha = _EscribirAlmacen(nombre_zip, temporal, filas, tipos, filas_por_bloque, codificacion)
+    except BaseException:
+        shutil.rmtree(temporal, ignore_errors=True)
+        raise
+
+    destino = os.path.join(raiz, fecha)
+    anterior = None
+    if os.path.isdir(destino):
+        anterior = os.path.join(raiz, '_anterior' + os.path.basename(temporal))
+        os.rename(destino, anterior)
+    os.rename(temporal, destino)
+    if anterior:
+        shutil.rmtree(anterior)
+    return destino
+
+
+def _EscribirAlmacen(nombre_zip, temporal, filas, tipos, filas_por_bloque, codificacion):
+    """ Escribe las columnas, el índice y los metadatos en el directorio
+        temporal. Regresa la fecha de actualización de la base."""
+
+    columnas = {columna: np.lib.format.open_memmap(os.path.join(temporal, columna + '.npy'),
+                                                   mode='w+', dtype=tipo, shape=(filas,))
+                for columna, tipo in tipos.items()}
+    inicio = 0
+    for bloque in _LeerBloques(nombre_zip, filas_por_bloque, codificacion):
+        fin = inicio + len(bloque)
+        for columna, tipo in tipos.items():
+            columnas[columna][inicio:fin] = _Convertir(bloque[columna], tipo)
+        inicio = fin
+
+    fecha = str(columnas['FECHA_ACTUALIZACION'][0]) if 'FECHA_ACTUALIZACION' in columnas else 'sin_fecha'
+    for arreglo in columnas.values():
+        arreglo.flush()
+
+    # Índice ordenado sobre la clave del registro
+    posiciones = np.argsort(columnas[clave], kind='stable')
+    np.save(os.path.join(temporal, archivo_posiciones), posiciones)
+    np.save(os.path.join(temporal, archivo_claves), columnas[clave][posiciones])
+    del columnas
+
+    with open(os.path.join(temporal, archivo_metadatos), 'w', encoding='utf-8') as archivo:
+        json.dump({'filas': filas, 'tipos': tipos, 'fecha_actualizacion': fecha,
+                   'origen': os.path.basename(nombre_zip)}, archivo, ensure_ascii=False, indent=1)
+    return fecha
+
+
+def AbrirAlmacen(directorio):
+    """ Abre un almacén como memoria mapeada. Sólo se leen los encabezados de
+        los archivos; los datos se cargan del disco conforme se consultan.
+        Regresa un diccionario con los metadatos, las columnas y el índice."""
+
+    with open(os.path.join(directorio, archivo_metadatos), encoding='utf-8') as archivo:
+        almacen = json.load(archivo)
+    almacen['columnas'] = {columna: np.load(os.path.join(directorio, columna + '.npy'), mmap_mode='r')
+                           for columna in almacen['tipos']}
+    almacen['claves'] = np.load(os.path.join(directorio, archivo_claves), mmap_mode='r')
+    almacen['posiciones'] = np.load(os.path.join(directorio, archivo_posiciones), mmap_mode='r')
+    return almacen
+
+
+def _DataFrame(almacen, filas, columnas=None):
+    datos = {}
+    for columna in columnas or almacen['tipos']:
+        valores = almacen['columnas'][columna][filas]
+        if valores.dtype.kind == 'S':
+            valores = np.char.decode(valores, 'utf-8')
+        datos[columna] = valores
+    return pd.DataFrame(datos)
+
+
+def _Ubicar(almacen, ids):
+    """ Busca los ID_REGISTRO en el índice ordenado. Regresa las claves
+        encontradas y su fila en el almacén. Los identificadores más largos
+        que el ancho del índice no pueden existir y se descartan antes de
+        convertirlos a ese ancho, que los truncaría y podría hacerlos
+        coincidir con otro registro."""
+
+    claves = almacen['claves']
+    buscados = np.char.encode(np.atleast_1d(np.asarray(ids, dtype=str)), 'utf-8')
+    buscados = buscados[np.char.str_len(buscados) <= claves.dtype.itemsize].astype(claves.dtype)
+    if len(buscados) == 0 or len(claves) == 0:
+        return buscados[:0], np.zeros(0, dtype=np.int64)
+    lugares = np.searchsorted(claves, buscados).clip(0, len(claves) - 1)
+    encontrados = claves[lugares] == buscados
+    return buscados[encontrados], almacen['posiciones'][lugares[encontrados]]
+
+
+def ValoresRegistro(almacen, id_registro, columnas=None):
+    """ Consulta rápida de un solo ID_REGISTRO: regresa un diccionario de
+        columna a valor tal como está guardado (bytes para el texto, enteros
+        de numpy y datetime64 para las fechas), o None si no existe. Evita
+        construir un DataFrame, que domina el tiempo de BuscarRegistros
+        cuando se consulta un solo registro."""
+
+    _, filas = _Ubicar(almacen, [id_registro])
+    if len(filas) == 0:
+        return None
+    fila = filas[0]
+    return {columna: almacen['columnas'][columna][fila] for columna in columnas or almacen['tipos']}
+
+
+def BuscarRegistros(almacen, ids, columnas=None):
+    """ Busca uno o varios ID_REGISTRO en un almacén abierto con AbrirAlmacen.
+        La búsqueda es binaria sobre el índice ordenado y sólo se leen las
+        filas encontradas. Regresa un DataFrame indexado por ID_REGISTRO, en el
+        orden solicitado; los identificadores inexistentes se omiten. Para un
+        solo registro, ValoresRegistro es mucho más rápido."""
+
+    buscados, filas = _Ubicar(almacen, ids)
+
+    # Las filas se leen en orden de disco y se regresan en el orden solicitado
+    orden = np.argsort(filas)
+    registros = _DataFrame(almacen, filas[orden], columnas)
+    registros.index = np.char.decode(buscados[orden], 'utf-8')
+    registros.index.name = clave
+    return registros.iloc[np.argsort(orden)]
+
+
+def Versiones(raiz):
+    """ Lista, de la más antigua a la más reciente, las versiones completas de
+        la base guardadas en raiz (se omiten las que están en construcción)."""
+
+    if not os.path.isdir(raiz):
+        return []
+    return [version for version in sorted(os.listdir(raiz))
+            if not version.startswith('_') and os.path.isfile(os.path.join(raiz, version, archivo_metadatos))]
+
+
+def BuscarHistorico(raiz, ids, columnas=None):
+    """ Busca los ID_REGISTRO indicados en todas las versiones de la base
+        guardadas en raiz. Regresa un DataFrame con una fila por registro y
+        versión, identificada por la columna VERSION."""
+
+    resultados = []
+    for version in Versiones(raiz):
+        registros = BuscarRegistros(AbrirAlmacen(os.path.join(raiz, version)), ids, columnas)
+        resultados.append(registros.assign(VERSION=version))
+    if not resultados:
+        return pd.DataFrame()
+    return pd.concat(resultados)
+
+
+def LeerAlmacen(almacen, columnas=None, filas=slice(None)):
+    """ Carga columnas de un almacén en un DataFrame, completas o sólo en el
+        rango de filas indicado."""
+
+    return _DataFrame(almacen, filas, columnas)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Almacén columnar de la base de casos de COVID-19.')
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+    construir = subparsers.add_parser('construir', help='Construye el almacén a partir del ZIP descargado')
+    construir.add_argument('zip')
+    construir.add_argument('raiz')
+    buscar = subparsers.add_parser('buscar', help='Busca registros en todas las versiones guardadas')
+    buscar.add_argument('raiz')
+    buscar.add_argument('ids', nargs='+')
+    argumentos = parser.parse_args()
+
+    if argumentos.comando == 'construir':
+        print(ConstruirAlmacen(argumentos.zip, argumentos.raiz))
+    else:
+        with pd.option_context('display.max_columns', None, 'display.width', None):
+            print(BuscarHistorico(argumentos.raiz, argumentos.ids))
@@ -0,0 +1,46 @@
+# coding: utf-8
+""" Compara el rendimiento de lectura de la base con pandas y con pyarrow
+    según el número de hilos.
+
+    Uso:
+        python benchmark_lectura.py [archivo.zip] [--repeticiones 5]
+
+    Reporta el mejor tiempo de cada configuración y el rendimiento en MB/s del
+    CSV sin comprimir."""
+
+import argparse
+import os
+import time
+import zipfile
+
+import pandas as pd
+
+from lectura_casos import LeerCasos
+
+
+def MejorTiempo(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rendimiento de lectura de la base de casos.')
+    parser.add_argument('zip', nargs='?', default='datos_abiertos_covid19_29.04.2020.zip')
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--diccionario', default='Descriptores_0419.xlsx')
+    argumentos = parser.parse_args()
+
+    diccionario = pd.read_excel(argumentos.diccionario)
+    with zipfile.ZipFile(argumentos.zip) as archivo_zip:
+        megabytes = sum(m.file_size for m in archivo_zip.infolist()) / 1e6
+
+    configuraciones = [('pandas', 1)] + [('arrow', hilos) for hilos in range(1, (os.cpu_count() or 1) + 1)]
+    print(f'{"Motor":<8}{"Hilos":>6}{"Segundos":>10}{"MB/s":>9}')
+    for motor, hilos in configuraciones:
+        segundos = MejorTiempo(lambda: LeerCasos(argumentos.zip, diccionario, motor=motor, hilos=hilos),
+                               argumentos.repeticiones)
+        print(f'{motor:<8}{hilos:>6}{segundos:>10.3f}{megabytes / segundos:>9.1f}')
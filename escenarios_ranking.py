@@ -0,0 +1,141 @@
+# coding: utf-8
+""" Barrido de umbrales del ranking de entidades federativas.
+
+    Evalúa el ranking de matriz_estados para una rejilla completa de
+    combinaciones de umbrales en un solo cálculo vectorizado: cada escenario es
+    una fila del eje de parámetros y cada entidad una columna."""
+
+import numpy as np
+import pandas as pd
+
+letalidad_mundial = 227623 / 3193165
+
+umbrales_base = {'incidencia_media': 50, 'incidencia_alta': 200,
+                 'letalidad_media': letalidad_mundial, 'letalidad_alta': letalidad_mundial * 2,
+                 'alza_moderada': 1.41, 'alza_importante': 2,
+                 'baja_moderada': 0.71, 'baja_importante': 0.5}
+
+
+def RejillaUmbrales(**valores):
+    """ Genera todas las combinaciones de los umbrales indicados.
+        Cada argumento (con los nombres de umbrales_base) recibe un valor o una
+        lista de valores; los umbrales no indicados conservan su valor base. Se
+        descartan las combinaciones incongruentes, por ejemplo una incidencia
+        media mayor que la alta."""
+
+    desconocidos = set(valores) - set(umbrales_base)
+    if desconocidos:
+        raise ValueError(f'Umbrales desconocidos: {sorted(desconocidos)}')
+
+    opciones = {nombre: np.atleast_1d(valores.get(nombre, base)).astype(float)
+                for nombre, base in umbrales_base.items()}
+    malla = np.meshgrid(*opciones.values(), indexing='ij')
+    rejilla = pd.DataFrame({nombre: m.ravel() for nombre, m in zip(opciones, malla)})
+
+    validos = ((rejilla['incidencia_media'] < rejilla['incidencia_alta']) &
+               (rejilla['letalidad_media'] < rejilla['letalidad_alta']) &
+               (rejilla['alza_moderada'] < rejilla['alza_importante']) &
+               (rejilla['baja_importante'] < rejilla['baja_moderada']))
+    return rejilla[validos].reset_index(drop=True)
+
+
+def RazonesCrecimiento(valores, fecha_corte):
+    """ Calcula las razones en las que se basa el indicador de tendencia.
+        valores es una serie de promedio móvil indexada por fecha. Regresa la
+        razón del último promedio móvil hasta fecha_corte respecto al de 14
+        días antes y la razón del último promedio móvil respecto al máximo."""
+
+    ultima_fecha = min(valores.index[-1], pd.Timestamp(fecha_corte))
+    if ultima_fecha not in valores.index:
+        ultima_fecha = valores.index[valores.index < ultima_fecha][-1]
+    vector = valores.dropna()[:ultima_fecha]
+    referencia = vector[ultima_fecha]
+
+    if ultima_fecha - vector.index[0] < pd.Timedelta(days=14):
+        periodo = vector.index[0]
+    else:
+        periodo = ultima_fecha - pd.Timedelta(days=14)
+        if periodo not in vector.index:
+            periodo = vector.index[vector.index < periodo][-1]
+    return referencia / vector[periodo], referencia / vector.max()
+
+
+def IndicadoresEstados(casos_confirmados, defunciones_confirmadas, poblacion_entidades, fecha_corte):
+    """ Reúne por entidad los datos que necesita el ranking: casos confirmados,
+        incidencia por millón de habitantes, letalidad y las razones de
+        crecimiento del promedio móvil de 7 días de casos por millón de
+        habitantes por fecha de inicio de síntomas."""
+
+    casos_estados = casos_confirmados['ENTIDAD_UM'].value_counts()
+    defunciones_estados = defunciones_confirmadas['ENTIDAD_UM'].value_counts()
+    confirmados_estados = casos_confirmados.groupby(['ENTIDAD_UM', 'FECHA_SINTOMAS'])['FECHA_SINTOMAS'].count()
+
+    razones = {}
+    for estado in casos_estados.index:
+        x1 = confirmados_estados[estado] / poblacion_entidades[estado] * 1000000
+        razones[estado] = RazonesCrecimiento(x1.rolling(window=7).mean(), fecha_corte)
+    razones = pd.DataFrame.from_dict(razones, orient='index', columns=['Razon periodo', 'Razon maximo'])
+
+    indicadores = pd.DataFrame({'Casos': casos_estados,
+                                'Incidencia': casos_estados / casos_estados.index.map(poblacion_entidades) * 1000000,
+                                'Letalidad': defunciones_estados.reindex(casos_estados.index, fill_value=0) / casos_estados})
+    return indicadores.join(razones)
+
+
+def IndicadoresRanking(indicadores, rejilla):
+    """ Clasifica a las entidades en cada escenario de la rejilla.
+        indicadores es un DataFrame por entidad con las columnas 'Casos',
+        'Incidencia' (por millón), 'Letalidad', 'Razon periodo' y 'Razon maximo'
+        (ver IndicadoresEstados). Replica los indicadores de matriz_estados y
+        regresa un diccionario con el lugar en casos (1 es el menor número de
+        casos) y, como arreglos de escenarios x entidades, los indicadores de
+        incidencia, letalidad y tendencia y el puntaje del ranking, que es el
+        lugar en casos normalizado más los tres indicadores."""
+
+    casos = indicadores['Casos'].values
+    incidencia = indicadores['Incidencia'].values[np.newaxis, :]
+    letalidad = indicadores['Letalidad'].fillna(0).values[np.newaxis, :]
+    razon_periodo = indicadores['Razon periodo'].values[np.newaxis, :]
+    razon_maximo = indicadores['Razon maximo'].values[np.newaxis, :]
+    u = {nombre: rejilla[nombre].values[:, np.newaxis] for nombre in umbrales_base}
+
+    lugar_casos = np.argsort(np.argsort(casos, kind='stable'), kind='stable') + 1
+
+    indice_incidencia = (incidencia > u['incidencia_media']).astype(int) + (incidencia > u['incidencia_alta'])
+    indice_letalidad = (letalidad > u['letalidad_media']).astype(int) + (letalidad > u['letalidad_alta'])
+    alza = 2 + (razon_periodo > u['alza_moderada']).astype(int) + (razon_periodo > u['alza_importante'])
+    baja = 2 - (razon_maximo < u['baja_moderada']).astype(int) - (razon_maximo < u['baja_importante'])
+    indice_tendencia = np.where(razon_maximo == 1, alza, baja)
+
+    puntaje = lugar_casos / lugar_casos.max() + indice_incidencia + indice_letalidad + indice_tendencia
+    return {'Lugar en casos': lugar_casos, 'Incidencia': indice_incidencia, 'Letalidad': indice_letalidad,
+            'Tendencia': indice_tendencia, 'Ranking': puntaje}
+
+
+def BarridoRanking(indicadores, rejilla):
+    """ Calcula el lugar de cada entidad en el ranking para cada escenario.
+        Regresa un DataFrame de escenarios x entidades con el lugar de cada
+        entidad (1 es el puntaje más alto, es decir, la situación más
+        negativa)."""
+
+    puntaje = IndicadoresRanking(indicadores, rejilla)['Ranking']
+    orden = np.argsort(-puntaje, axis=1, kind='stable')
+    lugares = np.empty_like(orden)
+    np.put_along_axis(lugares, orden, np.arange(1, len(indicadores) + 1)[np.newaxis, :], axis=1)
+    return pd.DataFrame(lugares, index=rejilla.index, columns=indicadores.index)
+
+
+def EstabilidadRanking(lugares, lugares_base):
+    """ Resume qué tan estable es el lugar de cada entidad entre escenarios.
+        Regresa por entidad el lugar con los umbrales base, el lugar promedio,
+        su desviación estándar, el mejor y el peor lugar, y la proporción de
+        escenarios en los que conserva el lugar base."""
+
+    lugares_base = pd.Series(lugares_base, index=lugares.columns)
+    estabilidad = pd.DataFrame({'Lugar base': lugares_base,
+                                'Lugar medio': lugares.mean(),
+                                'Desviacion': lugares.std(ddof=0),
+                                'Mejor lugar': lugares.min(),
+                                'Peor lugar': lugares.max(),
+                                'Coincidencia': (lugares == lugares_base).mean()})
+    return estabilidad.sort_values(by='Lugar base')
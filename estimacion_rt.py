@@ -0,0 +1,114 @@
+# coding: utf-8
+""" Estimación del número reproductivo efectivo (Rt) por entidad.
+
+    Implementa el método de Cori et al. (2013) basado en la ecuación de
+    renovación. Todas las series (entidades o municipios) se procesan a la vez
+    sobre una matriz de incidencia de grupo x fecha, sin ciclos por serie."""
+
+import numpy as np
+import pandas as pd
+from scipy import signal, stats
+
+
+def IntervaloSerial(media=4.7, desviacion=2.9, dias=21):
+    """ Discretiza un intervalo serial con distribución gamma.
+        Regresa un vector w de longitud dias + 1 en el que w[s] es la
+        probabilidad de que transcurran s días entre el inicio de síntomas de
+        un caso primario y el de un caso secundario (w[0] = 0). Los valores
+        por omisión corresponden a Nishiura et al. (2020)."""
+
+    forma = (media / desviacion) ** 2
+    escala = desviacion ** 2 / media
+    acumulada = stats.gamma.cdf(np.arange(dias + 1) + 0.5, forma, scale=escala)
+    w = np.concatenate(([0.0], np.diff(acumulada)))
+    return w / w.sum()
+
+
+def MatrizIncidencia(casos, columna_grupo, columna_fecha):
+    """ Construye la matriz densa de casos diarios de grupo x fecha.
+        Los grupos (entidades, municipios) van en el índice y todas las fechas
+        entre la primera y la última observada en las columnas, incluyendo los
+        días sin casos. columna_grupo puede ser una lista de columnas cuando el
+        grupo se identifica con una llave compuesta; por ejemplo, la clave de
+        MUNICIPIO_RES sólo es única dentro de cada entidad, por lo que los
+        municipios se agrupan con ['ENTIDAD_RES', 'MUNICIPIO_RES'] y el índice
+        resultante es un MultiIndex."""
+
+    fechas = casos[columna_fecha].dropna()
+    if isinstance(columna_grupo, str):
+        valores_grupo = casos.loc[fechas.index, columna_grupo]
+    else:
+        valores_grupo = pd.MultiIndex.from_frame(casos.loc[fechas.index, list(columna_grupo)])
+    grupos, claves = pd.factorize(valores_grupo, sort=True)
+    if not isinstance(columna_grupo, str):
+        claves.names = list(columna_grupo)
+    inicio = fechas.min()
+    dias = (fechas - inicio).dt.days.values
+    n_dias = dias.max() + 1
+
+    conteos = np.bincount(grupos * n_dias + dias, minlength=len(claves) * n_dias)
+    return pd.DataFrame(conteos.reshape(len(claves), n_dias), index=claves,
+                        columns=pd.date_range(inicio, periods=n_dias, freq='D'))
+
+
+def EstimacionRt(incidencia, intervalo_serial=None, ventana=7, a_priori=(1, 5),
+                 nivel=0.95, casos_minimos=12):
+    """ Estima Rt para cada fila y cada día de una matriz de incidencia.
+        La infectividad de cada día se obtiene convolucionando la incidencia
+        con el intervalo serial; las sumas móviles de casos e infectividad en
+        la ventana actualizan una distribución a priori gamma (forma, escala).
+        Regresa tres DataFrame con la forma de la incidencia: la media a
+        posteriori de Rt y los límites inferior y superior del intervalo de
+        credibilidad al nivel indicado. Los días sin información suficiente
+        (menos de casos_minimos acumulados o ventana incompleta) quedan en NaN."""
+
+    if intervalo_serial is None:
+        intervalo_serial = IntervaloSerial()
+    casos = np.asarray(incidencia, dtype=float)
+    n_dias = casos.shape[1]
+
+    # Infectividad: suma de casos previos ponderada por el intervalo serial
+    infectividad = signal.fftconvolve(casos, intervalo_serial[np.newaxis, :], axes=1)[:, :n_dias]
+    infectividad = np.clip(infectividad, 0, None)
+
+    def SumaMovil(matriz):
+        acumulada = np.cumsum(np.pad(matriz, ((0, 0), (1, 0))), axis=1)
+        suma = np.full_like(matriz, np.nan)
+        suma[:, ventana - 1:] = acumulada[:, ventana:] - acumulada[:, :-ventana]
+        return suma
+
+    forma = a_priori[0] + SumaMovil(casos)
+    escala = 1 / (1 / a_priori[1] + SumaMovil(infectividad))
+
+    validos = (np.cumsum(casos, axis=1) >= casos_minimos) & np.isfinite(forma)
+    forma = np.where(validos, forma, np.nan)
+    escala = np.where(validos, escala, np.nan)
+
+    alfa = (1 - nivel) / 2
+    resultados = (forma * escala,
+                  stats.gamma.ppf(alfa, forma, scale=escala),
+                  stats.gamma.ppf(1 - alfa, forma, scale=escala))
+    return tuple(pd.DataFrame(r, index=incidencia.index, columns=incidencia.columns)
+                 for r in resultados)
+
+
+def IndiceRt(media, inferior, superior, media_intervalo=4.7):
+    """ Asigna el indicador de tendencia de IndiceCrecimiento a partir de Rt.
+        Los umbrales equivalen a duplicar o reducir a la mitad los casos en 14
+        y 28 días, convertidos a Rt con la media del intervalo serial
+        (Rt = exp(r * media_intervalo)). Sólo se reporta alza o baja cuando el
+        intervalo de credibilidad excluye a 1. Donde Rt no se pudo estimar
+        (NaN) el indicador también es NaN, para no reportarlo como estable.
+        4. Alza importante. 3. Alza moderada. 2. Estable.
+        1. Baja moderada. 0. Baja importante."""
+
+    media, inferior, superior = (np.asarray(v, dtype=float) for v in (media, inferior, superior))
+    umbral = lambda dias: np.exp(np.log(2) / dias * media_intervalo)
+
+    indice = np.full(media.shape, 2.0)
+    indice[(inferior > 1) & (media > umbral(28))] = 3
+    indice[(inferior > 1) & (media > umbral(14))] = 4
+    indice[(superior < 1) & (media < 1 / umbral(28))] = 1
+    indice[(superior < 1) & (media < 1 / umbral(14))] = 0
+    indice[np.isnan(media) | np.isnan(inferior) | np.isnan(superior)] = np.nan
+    return indice
@@ -0,0 +1,132 @@
+# coding: utf-8
+""" Tensor de conteos estratificados de casos.
+
+    Cuenta los registros en todas las combinaciones de un conjunto de
+    dimensiones (grupo de edad, sexo, entidad, resultado, etc.) en una sola
+    pasada: cada registro se convierte en una clave entera combinada y los
+    conteos se obtienen con np.bincount. Las distribuciones de las gráficas y
+    tablas son marginales de ese tensor. Con muchas dimensiones el tensor
+    denso crece con el producto de sus tamaños; en ese caso se guarda en forma
+    dispersa, sólo con las combinaciones que tienen registros."""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+
+def BandasEdad(bordes):
+    """ Genera las etiquetas de los grupos definidos por bordes crecientes.
+        El último grupo queda abierto, por ejemplo [0, 10, 80] produce
+        ['0-9', '10-79', '80+']."""
+
+    return [f'{a}-{b - 1}' for a, b in zip(bordes[:-1], bordes[1:])] + [f'{bordes[-1]}+']
+
+
+def _Codificar(valores, eje):
+    """ Regresa el código de categoría de cada valor (-1 si queda fuera)."""
+
+    valores = np.asarray(valores)
+    if eje.get('bordes') is not None:
+        bordes = np.asarray(eje['bordes'])
+        codigos = np.searchsorted(bordes, valores, side='right') - 1
+        codigos[np.isnan(valores.astype(float))] = -1
+        return codigos
+
+    categorias = np.asarray(eje['categorias'])
+    orden = np.argsort(categorias, kind='stable')
+    posiciones = np.searchsorted(categorias[orden], valores).clip(0, len(categorias) - 1)
+    encontrados = categorias[orden][posiciones] == valores
+    return np.where(encontrados, orden[posiciones], -1)
+
+
+def TensorConteos(datos, ejes, disperso=False):
+    """ Construye el tensor de conteos de todas las combinaciones de ejes.
+        ejes es un diccionario ordenado {nombre: especificación} donde cada
+        especificación indica la columna de datos (por omisión el nombre del
+        eje) y, o bien 'categorias' (lista de valores, en el orden en que se
+        quieren reportar), o bien 'bordes' (límites inferiores crecientes de
+        grupos; el último grupo queda abierto) y opcionalmente 'etiquetas'. La
+        columna puede ser también una Series ya calculada. Con 'otros' (una
+        etiqueta) los valores fuera de las categorías, por debajo del primer
+        borde o faltantes se cuentan en una categoría adicional; sin ella esos
+        registros no se cuentan en ninguna marginal y se emite una advertencia
+        con su número. Con disperso = True el tensor se regresa como un
+        diccionario con la forma, las claves combinadas que tienen registros y
+        sus conteos. Regresa el tensor y la lista de etiquetas de cada eje."""
+
+    claves = np.zeros(len(datos), dtype=np.int64)
+    validos = np.ones(len(datos), dtype=bool)
+    forma, etiquetas, fuera = [], [], {}
+    for nombre, eje in ejes.items():
+        columna = eje.get('columna', nombre)
+        valores = columna.values if isinstance(columna, pd.Series) else datos[columna].values
+        codigos = _Codificar(valores, eje)
+        if eje.get('bordes') is not None:
+            etiquetas_eje = eje.get('etiquetas') or BandasEdad(list(eje['bordes']))
+        else:
+            etiquetas_eje = eje.get('etiquetas') or list(eje['categorias'])
+        if eje.get('otros') is not None:
+            codigos = np.where(codigos < 0, len(etiquetas_eje), codigos)
+            etiquetas_eje = list(etiquetas_eje) + [eje['otros']]
+        n = len(etiquetas_eje)
+
+        if (codigos < 0).any():
+            fuera[nombre] = int((codigos < 0).sum())
+        validos &= codigos >= 0
+        claves = claves * n + codigos
+        forma.append(n)
+        etiquetas.append(pd.Index(etiquetas_eje, name=nombre))
+
+    if fuera:
+        warnings.warn(f'{int((~validos).sum())} registros quedaron fuera del tensor por valores fuera de '
+                      f'las categorías de los ejes {fuera}')
+
+    if disperso:
+        claves, conteos = np.unique(claves[validos], return_counts=True)
+        return {'forma': tuple(forma), 'claves': claves, 'conteos': conteos}, etiquetas
+    tensor = np.bincount(claves[validos], minlength=int(np.prod(forma)))
+    return tensor.reshape(forma), etiquetas
+
+
+def Marginal(tensor, etiquetas, dimensiones, filtros=None):
+    """ Suma el tensor sobre todos los ejes excepto las dimensiones indicadas.
+        filtros es un diccionario {eje: etiqueta o lista de etiquetas} que
+        restringe los ejes antes de sumar, por ejemplo {'RESULTADO': 1}. El
+        tensor puede ser denso o disperso (ver TensorConteos). Con una
+        dimensión regresa una Series; con varias, una Series con índice
+        jerárquico, con las dimensiones en el orden indicado."""
+
+    nombres = [e.name for e in etiquetas]
+    seleccion = []
+    for eje in etiquetas:
+        if filtros and eje.name in filtros:
+            posiciones = eje.get_indexer(np.atleast_1d(filtros[eje.name]))
+            if (posiciones < 0).any():
+                raise KeyError(f'Etiqueta inexistente en el eje {eje.name}: {filtros[eje.name]}')
+            seleccion.append(posiciones)
+        else:
+            seleccion.append(np.arange(len(eje)))
+
+    dimensiones = [dimensiones] if isinstance(dimensiones, str) else list(dimensiones)
+    conservar = [nombres.index(d) for d in dimensiones]
+    if isinstance(tensor, dict):
+        codigos = np.unravel_index(tensor['claves'], tensor['forma'])
+        incluidos = np.ones(len(tensor['claves']), dtype=bool)
+        for i, eje in enumerate(etiquetas):
+            if filtros and eje.name in filtros:
+                incluidos &= np.isin(codigos[i], seleccion[i])
+        forma = [len(etiquetas[i]) for i in conservar]
+        planos = np.ravel_multi_index([codigos[i][incluidos] for i in conservar], forma)
+        marginal = np.bincount(planos, weights=tensor['conteos'][incluidos], minlength=int(np.prod(forma)))
+        marginal = marginal.astype(np.int64).reshape(forma)[np.ix_(*[seleccion[i] for i in conservar])]
+    else:
+        subtensor = tensor[np.ix_(*seleccion)]
+        sumar = tuple(i for i in range(len(nombres)) if i not in conservar)
+        marginal = np.moveaxis(subtensor.sum(axis=sumar), np.argsort(np.argsort(conservar)),
+                               range(len(conservar)))
+
+    indices = [etiquetas[i][seleccion[i]] for i in conservar]
+    if len(indices) == 1:
+        return pd.Series(marginal, index=indices[0])
+    return pd.Series(marginal.ravel(), index=pd.MultiIndex.from_product(indices))
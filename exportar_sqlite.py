@@ -0,0 +1,186 @@
+# coding: utf-8
+""" Exportación de los agregados del análisis a una base SQLite.
+
+    Guarda los agregados de cada versión de la base (ver agregados) en tablas
+    con la versión como parte de la llave primaria, de modo que las
+    herramientas de consulta puedan revisar el histórico sin volver a procesar
+    los datos. Cada versión se escribe en una sola transacción con
+    executemany: si la versión ya estaba en la base, sus filas anteriores se
+    eliminan en la misma transacción, de modo que no quedan filas que el
+    nuevo cálculo ya no produce. Al exportar un almacén completo se omiten
+    las versiones que ya están en la base.
+
+    Uso:
+        python exportar_sqlite.py almacen agregados_covid19.sqlite [--reemplazar]"""
+
+import argparse
+import os
+import sqlite3
+from datetime import date, datetime
+
+import pandas as pd
+
+from agregados import CalcularAgregados, Entidades, Instituciones, PoblacionEntidades, PrepararCasos
+from almacen_columnar import AbrirAlmacen, LeerAlmacen, Versiones
+
+# Columnas, llave primaria e índices adicionales de cada tabla
+esquema = {
+    'versiones': {'columnas': {'version': 'TEXT', 'registros': 'INTEGER', 'fecha_exportacion': 'TEXT'},
+                  'llave': ['version'], 'indices': []},
+    'totales': {'columnas': {'version': 'TEXT', 'estado': 'TEXT', 'casos': 'INTEGER'},
+                'llave': ['version', 'estado'], 'indices': []},
+    'distribuciones': {'columnas': {'version': 'TEXT', 'grafica': 'TEXT', 'categoria': 'TEXT', 'casos': 'INTEGER'},
+                       'llave': ['version', 'grafica', 'categoria'], 'indices': []},
+    'series_diarias': {'columnas': {'version': 'TEXT', 'tipo_fecha': 'TEXT', 'fecha': 'TEXT',
+                                    'estudiados': 'INTEGER', 'confirmados': 'INTEGER',
+                                    'hospitalizados_confirmados': 'INTEGER', 'defunciones_confirmadas': 'INTEGER'},
+                       'llave': ['version', 'tipo_fecha', 'fecha'],
+                       'indices': [['tipo_fecha', 'fecha', 'version']]},
+    'confirmados_estados': {'columnas': {'version': 'TEXT', 'entidad_um': 'INTEGER', 'entidad': 'TEXT',
+                                         'fecha_sintomas': 'TEXT', 'casos': 'INTEGER'},
+                            'llave': ['version', 'entidad_um', 'fecha_sintomas'],
+                            'indices': [['entidad_um', 'fecha_sintomas', 'version']]},
+    'matriz_estados': {'columnas': {'version': 'TEXT', 'entidad': 'TEXT', 'lugar_en_casos': 'INTEGER',
+                                    'incidencia': 'TEXT', 'letalidad': 'TEXT', 'tendencia': 'TEXT',
+                                    'ranking': 'REAL', 'casos': 'INTEGER', 'casos_por_millon': 'REAL',
+                                    'tasa_letalidad': 'REAL'},
+                       'llave': ['version', 'entidad'], 'indices': [['entidad', 'version']]},
+    'comorbilidad': {'columnas': {'version': 'TEXT', 'comorbilidad': 'TEXT', 'tipo_atencion': 'TEXT',
+                                  'porcentaje': 'REAL'},
+                     'llave': ['version', 'comorbilidad', 'tipo_atencion'], 'indices': []}}
+
+# Columna del DataFrame de cada agregado que corresponde a cada columna de la tabla
+columnas_agregados = {
+    'totales': {'estado': 'Estado', 'casos': 'Casos'},
+    'distribuciones': {'grafica': 'Grafica', 'categoria': 'Categoria', 'casos': 'Casos'},
+    'series_diarias': {'tipo_fecha': 'TIPO_FECHA', 'fecha': 'FECHA', 'estudiados': 'Estudiados',
+                       'confirmados': 'Confirmados', 'hospitalizados_confirmados': 'Hospitalizados confirmados',
+                       'defunciones_confirmadas': 'Defunciones confirmadas'},
+    'confirmados_estados': {'entidad_um': 'ENTIDAD_UM', 'entidad': 'ENTIDAD', 'fecha_sintomas': 'FECHA_SINTOMAS',
+                            'casos': 'Casos'},
+    'matriz_estados': {'entidad': 'ENTIDAD', 'lugar_en_casos': 'Lugar en casos', 'incidencia': 'Incidencia',
+                       'letalidad': 'Letalidad', 'tendencia': 'Tendencia', 'ranking': 'Ranking', 'casos': 'Casos',
+                       'casos_por_millon': 'Casos por millon', 'tasa_letalidad': 'Tasa de letalidad'},
+    'comorbilidad': {'comorbilidad': 'Comorbilidad', 'tipo_atencion': 'Tipo de atencion',
+                     'porcentaje': 'Porcentaje'}}
+
+# Agregados de series diarias y la columna de fecha que usa cada uno
+series = {'series_ingreso': 'FECHA_INGRESO', 'series_sintomas': 'FECHA_SINTOMAS',
+          'series_defuncion': 'FECHA_DEF'}
+
+
+def Conectar(ruta):
+    """ Abre la base SQLite y crea las tablas e índices que falten. El modo WAL
+        permite consultar la base mientras se exporta una versión."""
+
+    conexion = sqlite3.connect(ruta)
+    conexion.execute('PRAGMA journal_mode = WAL')
+    conexion.execute('PRAGMA synchronous = NORMAL')
+    with conexion:
+        for tabla, definicion in esquema.items():
+            columnas = ', '.join(f'{columna} {tipo}' for columna, tipo in definicion['columnas'].items())
+            conexion.execute(f'CREATE TABLE IF NOT EXISTS {tabla} ({columnas}, '
+                             f'PRIMARY KEY ({", ".join(definicion["llave"])}))')
+            for indice in definicion['indices']:
+                conexion.execute(f'CREATE INDEX IF NOT EXISTS {tabla}_{"_".join(indice)} '
+                                 f'ON {tabla} ({", ".join(indice)})')
+    return conexion
+
+
+def _Upsert(tabla):
+    definicion = esquema[tabla]
+    columnas = list(definicion['columnas'])
+    actualizar = [columna for columna in columnas if columna not in definicion['llave']]
+    return (f'INSERT INTO {tabla} ({", ".join(columnas)}) VALUES ({", ".join("?" * len(columnas))}) '
+            f'ON CONFLICT ({", ".join(definicion["llave"])}) DO UPDATE SET '
+            + ', '.join(f'{columna} = excluded.{columna}' for columna in actualizar))
+
+
+def _Registros(nombre, version, tabla):
+    """ Convierte un DataFrame en tuplas de tipos nativos de Python, con las
+        fechas en formato ISO, los valores faltantes como NULL y la versión
+        como primera columna, en el orden de columnas del esquema."""
+
+    tabla = tabla[[columna for columna in esquema[nombre]['columnas'] if columna != 'version']].copy()
+    for columna in tabla.columns:
+        if pd.api.types.is_datetime64_any_dtype(tabla[columna]):
+            tabla[columna] = tabla[columna].dt.strftime('%Y-%m-%d')
+    tabla = tabla.astype(object).where(tabla.notna(), None)
+    tabla.insert(0, 'version', version)
+    return list(tabla.itertuples(index=False, name=None))
+
+
+def TablasExportacion(agregados):
+    """ Acomoda los agregados calculados con CalcularAgregados en el formato
+        largo de las tablas de la base. Las columnas se eligen por nombre
+        según columnas_agregados y se renombran como en el esquema, por lo
+        que el orden de las columnas de los agregados no importa."""
+
+    series_diarias = pd.concat({columna: agregados[nombre].rename_axis('FECHA') for nombre, columna in series.items()},
+                               names=['TIPO_FECHA', 'FECHA'])
+    comorbilidad = agregados['comorbilidad'].rename_axis(columns='Tipo de atencion').stack().rename('Porcentaje')
+    tablas = {'totales': agregados['totales'].reset_index(),
+              'distribuciones': agregados['distribuciones'].reset_index(),
+              'series_diarias': series_diarias.reset_index(),
+              'confirmados_estados': agregados['confirmados_estados'],
+              'matriz_estados': agregados['matriz_estados'].reset_index(),
+              'comorbilidad': comorbilidad.reset_index()}
+    return {tabla: datos[list(columnas_agregados[tabla].values())].set_axis(list(columnas_agregados[tabla]), axis=1)
+            for tabla, datos in tablas.items()}
+
+
+def ExportarAgregados(conexion, version, agregados, registros=None):
+    """ Escribe los agregados de una versión en una sola transacción. Si la
+        versión ya estaba en la base, sus filas se reemplazan por completo."""
+
+    with conexion:
+        for tabla, datos in TablasExportacion(agregados).items():
+            conexion.execute(f'DELETE FROM {tabla} WHERE version = ?', (version,))
+            conexion.executemany(_Upsert(tabla), _Registros(tabla, version, datos))
+        conexion.execute(_Upsert('versiones'), (version, registros, datetime.now().isoformat(timespec='seconds')))
+
+
+def VersionesExportadas(conexion):
+    """ Versiones que ya están en la base."""
+
+    return {version for version, in conexion.execute('SELECT version FROM versiones')}
+
+
+def ExportarAlmacen(raiz, ruta, reemplazar=False,
+                    ruta_catalogos='Catalogos_0412.xlsx', ruta_poblacion='pob_ini_proyecciones.csv'):
+    """ Exporta todas las versiones del almacén columnar que no estén aún en la
+        base (o todas, con reemplazar). Regresa la lista de versiones
+        exportadas."""
+
+    entidades = Entidades(ruta_catalogos)
+    instituciones = Instituciones(ruta_catalogos)
+    poblacion_entidades = PoblacionEntidades(ruta_poblacion)
+
+    conexion = Conectar(ruta)
+    exportadas = set() if reemplazar else VersionesExportadas(conexion)
+    pendientes = [version for version in Versiones(raiz) if version not in exportadas]
+    try:
+        for version in pendientes:
+            almacen = AbrirAlmacen(os.path.join(raiz, version))
+            casos_totales = PrepararCasos(LeerAlmacen(almacen))
+            agregados = CalcularAgregados(casos_totales, entidades, poblacion_entidades,
+                                          date.fromisoformat(almacen['fecha_actualizacion']),
+                                          instituciones=instituciones)
+            ExportarAgregados(conexion, almacen['fecha_actualizacion'], agregados, almacen['filas'])
+            print('Versión exportada:', version)
+    finally:
+        conexion.close()
+    return pendientes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Exporta los agregados de COVID-19 a SQLite.')
+    parser.add_argument('raiz', help='Directorio raíz del almacén columnar')
+    parser.add_argument('base', help='Archivo de la base SQLite')
+    parser.add_argument('--reemplazar', action='store_true', help='Vuelve a exportar las versiones existentes')
+    parser.add_argument('--catalogos', default='Catalogos_0412.xlsx')
+    parser.add_argument('--poblacion', default='pob_ini_proyecciones.csv')
+    argumentos = parser.parse_args()
+
+    ExportarAlmacen(argumentos.raiz, argumentos.base, argumentos.reemplazar,
+                    argumentos.catalogos, argumentos.poblacion)
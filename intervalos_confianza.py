@@ -0,0 +1,143 @@
+# coding: utf-8
+""" Intervalos de confianza para indicadores por entidad federativa.
+
+    Calcula intervalos exactos (binomial de Clopper-Pearson y Poisson de
+    Garwood) o por bootstrap para la letalidad, la incidencia y la prevalencia
+    de comorbilidades. El bootstrap de proporciones remuestrea la tabla
+    completa de conteos con extracciones multinomiales vectorizadas, y el de
+    tasas extrae conteos de Poisson independientes por entidad; en ambos casos
+    las réplicas se reparten en bloques entre un grupo de procesos con
+    semillas reproducibles."""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+
+def IntervaloBinomial(exitos, totales, nivel=0.95):
+    """ Intervalo exacto de Clopper-Pearson para proporciones exitos / totales."""
+
+    exitos, totales = np.asarray(exitos, dtype=float), np.asarray(totales, dtype=float)
+    alfa = (1 - nivel) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inferior = np.where(exitos > 0, stats.beta.ppf(alfa, exitos, totales - exitos + 1), 0.0)
+        superior = np.where(exitos < totales, stats.beta.ppf(1 - alfa, exitos + 1, totales - exitos), 1.0)
+    sin_datos = totales == 0
+    inferior[sin_datos], superior[sin_datos] = np.nan, np.nan
+    return inferior, superior
+
+
+def IntervaloPoisson(conteos, nivel=0.95):
+    """ Intervalo exacto de Garwood para la media de conteos de Poisson."""
+
+    conteos = np.asarray(conteos, dtype=float)
+    alfa = (1 - nivel) / 2
+    inferior = np.where(conteos > 0, stats.gamma.ppf(alfa, np.maximum(conteos, 1)), 0.0)
+    superior = stats.gamma.ppf(1 - alfa, conteos + 1)
+    return inferior, superior
+
+
+def _BloqueMultinomial(argumentos):
+    semilla, replicas, n, probabilidades = argumentos
+    return np.random.default_rng(semilla).multinomial(n, probabilidades, size=replicas)
+
+
+def _BloquePoisson(argumentos):
+    semilla, replicas, medias = argumentos
+    return np.random.default_rng(semilla).poisson(medias, size=(replicas, len(medias)))
+
+
+def _Replicas(funcion, parametros, replicas, semilla, procesos, tamano_bloque):
+    """ Genera las réplicas en bloques de tamano_bloque, cada uno con una
+        semilla derivada de la semilla principal, por lo que el resultado no
+        depende del número de procesos."""
+
+    bloques = [min(tamano_bloque, replicas - inicio) for inicio in range(0, replicas, tamano_bloque)]
+    semillas = np.random.SeedSequence(semilla).spawn(len(bloques))
+    tareas = [(s, b) + parametros for s, b in zip(semillas, bloques)]
+
+    procesos = procesos or os.cpu_count()
+    if procesos == 1 or len(tareas) == 1:
+        return np.concatenate(list(map(funcion, tareas)))
+    with ProcessPoolExecutor(max_workers=procesos) as grupo:
+        return np.concatenate(list(grupo.map(funcion, tareas)))
+
+
+def BootstrapConteos(conteos, replicas=10000, semilla=None, procesos=1, tamano_bloque=1000):
+    """ Remuestrea una tabla de conteos con reemplazo.
+        Cada réplica es una extracción multinomial del total de registros con
+        las proporciones observadas en cada celda, por lo que el total se
+        mantiene fijo. Regresa un arreglo de réplicas x celdas."""
+
+    conteos = np.asarray(conteos, dtype=np.int64).ravel()
+    n = int(conteos.sum())
+    return _Replicas(_BloqueMultinomial, (n, conteos / n), replicas, semilla, procesos, tamano_bloque)
+
+
+def BootstrapPoisson(conteos, replicas=10000, semilla=None, procesos=1, tamano_bloque=1000):
+    """ Bootstrap paramétrico de conteos de Poisson: cada réplica extrae un
+        conteo independiente por celda con media igual al conteo observado, de
+        modo que la varianza de cada celda es su media y no depende del resto.
+        Regresa un arreglo de réplicas x celdas."""
+
+    medias = np.asarray(conteos, dtype=float).ravel()
+    return _Replicas(_BloquePoisson, (medias,), replicas, semilla, procesos, tamano_bloque)
+
+
+def _Resumen(estimacion, inferior, superior, indice):
+    return pd.DataFrame({'Estimacion': estimacion, 'Inferior': inferior, 'Superior': superior},
+                        index=indice)
+
+
+def IntervalosProporcion(exitos, totales, nivel=0.95, replicas=0, semilla=None, procesos=1,
+                         totales_minimos=30):
+    """ Intervalos para proporciones por entidad (letalidad, prevalencia).
+        exitos y totales son Series con el mismo índice. Con replicas = 0 se usa
+        el intervalo exacto de Clopper-Pearson; en otro caso, el intervalo de
+        percentiles de un bootstrap sobre la tabla de éxitos y fracasos de
+        todas las entidades. El intervalo de percentiles se degenera cuando
+        hay pocos casos o ningún éxito o fracaso (0 de 5 da [0, 0]), por lo
+        que en las entidades con menos de totales_minimos casos o con
+        proporción de 0 o 1 se usa también el intervalo exacto."""
+
+    exitos = pd.Series(exitos)
+    totales = pd.Series(totales).reindex(exitos.index, fill_value=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        estimacion = exitos / totales
+
+    if not replicas:
+        return _Resumen(estimacion, *IntervaloBinomial(exitos, totales, nivel), exitos.index)
+
+    tabla = np.stack([exitos.values, (totales - exitos).values], axis=1)
+    muestras = BootstrapConteos(tabla, replicas, semilla, procesos).reshape(replicas, -1, 2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        proporciones = muestras[:, :, 0] / muestras.sum(axis=2)
+    alfa = (1 - nivel) / 2 * 100
+    inferior, superior = np.nanpercentile(proporciones, [alfa, 100 - alfa], axis=0)
+
+    exactos = ((totales < totales_minimos) | (exitos == 0) | (exitos == totales)).values
+    inferior_exacto, superior_exacto = IntervaloBinomial(exitos, totales, nivel)
+    inferior[exactos], superior[exactos] = inferior_exacto[exactos], superior_exacto[exactos]
+    return _Resumen(estimacion, inferior, superior, exitos.index)
+
+
+def IntervalosTasa(conteos, poblacion, factor=1000000, nivel=0.95, replicas=0, semilla=None, procesos=1):
+    """ Intervalos para tasas por entidad, como la incidencia por millón.
+        Con replicas = 0 se usa el intervalo exacto de Poisson; en otro caso, el
+        intervalo de percentiles de un bootstrap de Poisson independiente para
+        cada entidad."""
+
+    conteos = pd.Series(conteos)
+    poblacion = np.asarray(poblacion, dtype=float)
+    estimacion = conteos / poblacion * factor
+
+    if not replicas:
+        inferior, superior = IntervaloPoisson(conteos, nivel)
+    else:
+        muestras = BootstrapPoisson(conteos.values, replicas, semilla, procesos)
+        alfa = (1 - nivel) / 2 * 100
+        inferior, superior = np.percentile(muestras, [alfa, 100 - alfa], axis=0)
+    return _Resumen(estimacion, inferior / poblacion * factor, superior / poblacion * factor, conteos.index)
@@ -0,0 +1,85 @@
+# coding: utf-8
+""" Lectura de la base de casos estudiados desde el ZIP de datos abiertos.
+
+    Además de la lectura con pandas que usa el análisis, ofrece un lector con
+    pyarrow: el miembro del ZIP se descomprime como flujo, se transcodifica de
+    latin-1 al vuelo y se analiza con varios hilos usando los tipos de dato
+    del diccionario de datos (Descriptores_0419.xlsx)."""
+
+import zipfile
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+except ImportError:
+    pa = None
+
+# Nombres de columna del CSV que difieren del diccionario de datos
+alias_columnas = {'OTRAS_COM': 'OTRA_COM'}
+
+# Las columnas de fecha que se convierten; FECHA_ACTUALIZACION se conserva como texto
+columnas_fecha = ['FECHA_INGRESO', 'FECHA_SINTOMAS', 'FECHA_DEF']
+
+
+def EsquemaArrow(diccionario):
+    """ Traduce el diccionario de datos a tipos de pyarrow por columna.
+        Las columnas con catálogo y la edad son enteros, las fechas son
+        date32 y el resto texto."""
+
+    tipos = {}
+    for nombre, formato in zip(diccionario['NOMBRE DE VARIABLE'], diccionario['FORMATO O FUENTE']):
+        nombre, formato = str(nombre).strip(), str(formato).strip().upper()
+        if nombre in columnas_fecha:
+            tipo = pa.date32()
+        elif formato.startswith(('CATÁLOGO', 'CATALÓGO', 'CATALOGO')) or formato.startswith('NÚMERICA'):
+            tipo = pa.int16()
+        else:
+            tipo = pa.string()
+        tipos[nombre] = tipo
+        if nombre in alias_columnas:
+            tipos[alias_columnas[nombre]] = tipo
+    return tipos
+
+
+def _AbrirMiembro(archivo_zip):
+    miembro = [m for m in archivo_zip.namelist() if m.lower().endswith('.csv')][0]
+    return archivo_zip.open(miembro)
+
+
+def LeerArrow(nombre, diccionario, codificacion='latin-1', hilos=None, tamano_bloque=1 << 22):
+    """ Lee el CSV del ZIP como tabla de pyarrow con lectura multihilo.
+        hilos fija el número de hilos de pyarrow sólo durante la lectura (por
+        omisión, uno por núcleo)."""
+
+    if pa is None:
+        raise ImportError('El motor arrow requiere pyarrow')
+
+    opciones_lectura = pa_csv.ReadOptions(use_threads=True, block_size=tamano_bloque, encoding=codificacion)
+    opciones_conversion = pa_csv.ConvertOptions(column_types=EsquemaArrow(diccionario),
+                                                null_values=['9999-99-99'], strings_can_be_null=False)
+    # El número de hilos de pyarrow es global al proceso; se restablece al terminar
+    hilos_previos = pa.cpu_count()
+    if hilos:
+        pa.set_cpu_count(hilos)
+    try:
+        with zipfile.ZipFile(nombre) as archivo_zip, _AbrirMiembro(archivo_zip) as csv:
+            return pa_csv.read_csv(csv, read_options=opciones_lectura, convert_options=opciones_conversion)
+    finally:
+        pa.set_cpu_count(hilos_previos)
+
+
+def LeerCasos(nombre, diccionario=None, motor='pandas', codificacion='latin-1', hilos=None):
+    """ Lee la base de casos estudiados del ZIP descargado.
+        motor = 'pandas' usa pd.read_csv como el análisis original; motor =
+        'arrow' usa LeerArrow y convierte la tabla a pandas sin duplicarla en
+        memoria (cada columna en su propio bloque, liberando la tabla de
+        pyarrow conforme se convierte)."""
+
+    if motor == 'pandas':
+        return pd.read_csv(nombre, encoding=codificacion)
+    if motor == 'arrow':
+        tabla = LeerArrow(nombre, diccionario, codificacion, hilos)
+        return tabla.to_pandas(split_blocks=True, self_destruct=True, date_as_object=False)
+    raise ValueError(f'Motor de lectura desconocido: {motor}')
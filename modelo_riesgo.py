@@ -0,0 +1,222 @@
+# coding: utf-8
+""" Modelo logístico de riesgo de defunción o intubación.
+
+    Ajusta una regresión logística sobre edad, sexo, comorbilidades, sector y
+    entidad de atención leyendo la base por bloques, por lo que la memoria
+    usada no depende del número de registros. Cada iteración del método de
+    Newton (IRLS) recorre los bloques una vez y sólo acumula el gradiente y la
+    matriz hessiana, de tamaño fijo. Con los coeficientes se obtienen razones
+    de momios ajustadas para cada comorbilidad.
+
+    Antes del ajuste se cuentan los casos y eventos de cada variable
+    indicadora; las que no tienen casos, no tienen eventos o sólo tienen
+    eventos no se pueden estimar (separación completa) y se excluyen del
+    modelo. Si la variable excluida es una categoría de SECTOR o ENTIDAD_UM,
+    también se excluyen del ajuste sus registros, que de otro modo quedarían
+    en la categoría de referencia; Puntuar no asigna probabilidad a esos
+    casos."""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+from scipy import special, stats
+
+from agregados import atributos_comorbilidad
+from almacen_columnar import LeerAlmacen
+
+# Categorías de las variables de catálogo y la categoría de referencia (SSA y Ciudad de México).
+# Los valores fuera del catálogo (como 99, no especificado) forman una categoría aparte, <columna>_otros
+categorias_base = {'SECTOR': (list(range(1, 14)), 12),
+                   'ENTIDAD_UM': (list(range(1, 33)), 9)}
+
+
+def BloquesZip(nombre, filas_por_bloque=500000, codificacion='latin-1'):
+    """ Regresa una función que, cada vez que se llama, genera la base del ZIP
+        por bloques de filas_por_bloque registros."""
+
+    def Bloques():
+        return pd.read_csv(nombre, encoding=codificacion, chunksize=filas_por_bloque)
+    return Bloques
+
+
+def BloquesAlmacen(almacen, filas_por_bloque=500000):
+    """ Igual que BloquesZip, a partir de un almacén abierto con AbrirAlmacen."""
+
+    def Bloques():
+        for inicio in range(0, almacen['filas'], filas_por_bloque):
+            yield LeerAlmacen(almacen, filas=slice(inicio, inicio + filas_por_bloque))
+    return Bloques
+
+
+def NombresVariables(categorias=None):
+    """ Nombres de las columnas de la matriz de diseño."""
+
+    categorias = categorias or categorias_base
+    nombres = ['Intercepto', 'EDAD (por 10 años)', 'EDAD^2', 'HOMBRE'] + atributos_comorbilidad
+    for columna, (valores, referencia) in categorias.items():
+        nombres += [f'{columna}_{valor}' for valor in valores if valor != referencia] + [f'{columna}_otros']
+    return nombres
+
+
+def MatrizDisenio(casos, categorias=None):
+    """ Construye la matriz de diseño de un bloque de casos. La edad se centra
+        en 50 años; las comorbilidades valen 1 sólo si se registró que sí se
+        presentan; las variables de catálogo se codifican con una columna por
+        categoría, excepto la de referencia, más una columna para los valores
+        fuera del catálogo."""
+
+    categorias = categorias or categorias_base
+    casos = casos.rename(columns={'OTRA_COM': 'OTRAS_COM'})
+    edad = (casos['EDAD'].values - 50) / 10
+
+    columnas = [np.ones(len(casos)), edad, edad ** 2, casos['SEXO'].values == 2]
+    columnas += [casos[atributo].values == 1 for atributo in atributos_comorbilidad]
+    for columna, (valores, referencia) in categorias.items():
+        codigos = casos[columna].values
+        columnas += [codigos == valor for valor in valores if valor != referencia]
+        columnas.append(~np.isin(codigos, valores))
+    return np.column_stack(columnas).astype(float)
+
+
+def Objetivo(casos, objetivo):
+    """ Variable de respuesta: 'DEFUNCION' o 'INTUBADO'."""
+
+    if objetivo == 'DEFUNCION':
+        return pd.to_datetime(casos['FECHA_DEF'], errors='coerce', format='%Y-%m-%d').notna().values.astype(float)
+    if objetivo == 'INTUBADO':
+        return (casos['INTUBADO'].values == 1).astype(float)
+    raise ValueError(f'Objetivo desconocido: {objetivo}')
+
+
+def _Categoricas(categorias=None):
+    """ Columnas de la matriz de diseño que codifican categorías de catálogo."""
+
+    return np.arange(len(NombresVariables(categorias))) >= 4 + len(atributos_comorbilidad)
+
+
+def _Bloques(bloques, objetivo, categorias, solo_confirmados, excluidas=None):
+    """ Matriz de diseño y respuesta de cada bloque. Se omiten los registros
+        que valen 1 en alguna de las columnas excluidas."""
+
+    for bloque in bloques():
+        if solo_confirmados:
+            bloque = bloque[bloque['RESULTADO'] == 1]
+        X, y = MatrizDisenio(bloque, categorias), Objetivo(bloque, objetivo)
+        if excluidas is not None and excluidas.any():
+            filas = ~X[:, excluidas].any(axis=1)
+            X, y = X[filas], y[filas]
+        yield X, y
+
+
+def VariablesEstimables(bloques, objetivo='DEFUNCION', categorias=None, solo_confirmados=True, excluidas=None):
+    """ Cuenta en una pasada por la base los casos y eventos de cada variable
+        indicadora (sexo, comorbilidades y categorías). Regresa un DataFrame
+        con los conteos y, para las variables que no se pueden estimar, el
+        motivo: sin casos, sin eventos o todos con evento. excluidas es una
+        máscara de columnas cuyos registros no se cuentan."""
+
+    nombres = NombresVariables(categorias)
+    casos, eventos = np.zeros(len(nombres)), np.zeros(len(nombres))
+    for X, y in _Bloques(bloques, objetivo, categorias, solo_confirmados, excluidas):
+        casos += (X != 0).sum(axis=0)
+        eventos += (X != 0).T @ y
+    variables = pd.DataFrame({'Casos': casos, 'Eventos': eventos}, index=nombres).astype(int)
+
+    indicadoras = np.arange(len(nombres)) >= 3
+    variables['No estimable'] = None
+    variables.loc[indicadoras & (casos > 0) & (eventos == casos), 'No estimable'] = 'todos con evento'
+    variables.loc[indicadoras & (eventos == 0), 'No estimable'] = 'sin eventos'
+    variables.loc[indicadoras & (casos == 0), 'No estimable'] = 'sin casos'
+    return variables
+
+
+def AjustarModelo(bloques, objetivo='DEFUNCION', categorias=None, solo_confirmados=True,
+                  l2=1e-4, iteraciones=25, tolerancia=1e-6):
+    """ Ajusta el modelo logístico recorriendo la base por bloques.
+        bloques es una función que genera los bloques de la base (ver
+        BloquesZip y BloquesAlmacen). La primera pasada (VariablesEstimables)
+        excluye las variables sin casos o con separación completa; si alguna
+        es una categoría de catálogo, sus registros se excluyen y se vuelven a
+        contar los demás hasta que no haya nuevas exclusiones. l2 es una
+        penalización pequeña sobre los coeficientes. Si el método no converge
+        en el número de iteraciones indicado (al menos una) se emite una
+        advertencia.
+        Regresa un diccionario con los coeficientes, su matriz de covarianza y
+        los datos del ajuste; las variables excluidas y su motivo quedan en
+        'no_estimables', y la máscara de las categorías cuyos registros se
+        excluyeron, en 'excluidas'."""
+
+    if iteraciones < 1:
+        raise ValueError(f'Se necesita al menos una iteración: {iteraciones}')
+    categorias = categorias or categorias_base
+    categoricas = _Categoricas(categorias)
+    excluidas = np.zeros(len(categoricas), dtype=bool)
+    motivos = pd.Series(None, index=NombresVariables(categorias), dtype=object)
+    while True:
+        variables = VariablesEstimables(bloques, objetivo, categorias, solo_confirmados, excluidas)
+        nuevas = categoricas & ~excluidas & variables['No estimable'].notna().values & (variables['Casos'] > 0).values
+        if not nuevas.any():
+            break
+        motivos[nuevas] = variables['No estimable'][nuevas] + ' (registros excluidos del ajuste)'
+        excluidas |= nuevas
+    variables['No estimable'] = motivos.where(excluidas, variables['No estimable'])
+    activas = variables['No estimable'].isna().values
+    nombres = list(variables.index[activas])
+    p = len(nombres)
+    penalizacion = np.full(p, l2)
+    penalizacion[0] = 0
+
+    beta = np.zeros(p)
+    for iteracion in range(1, iteraciones + 1):
+        gradiente, hessiana = -penalizacion * beta, np.diag(penalizacion)
+        log_verosimilitud, observaciones = -0.5 * np.sum(penalizacion * beta ** 2), 0
+        for X, y in _Bloques(bloques, objetivo, categorias, solo_confirmados, excluidas):
+            X = X[:, activas]
+            eta = X @ beta
+            mu = special.expit(eta)
+            gradiente += X.T @ (y - mu)
+            hessiana += (X * (mu * (1 - mu))[:, np.newaxis]).T @ X
+            log_verosimilitud += np.sum(y * eta - np.logaddexp(0, eta))
+            observaciones += len(y)
+
+        paso = np.linalg.solve(hessiana, gradiente)
+        beta += paso
+        if np.max(np.abs(paso)) < tolerancia:
+            break
+    else:
+        warnings.warn(f'El modelo no convergió en {iteraciones} iteraciones '
+                      f'(paso máximo {np.max(np.abs(paso)):.2g})')
+
+    return {'coeficientes': pd.Series(beta, index=nombres),
+            'covarianza': pd.DataFrame(np.linalg.inv(hessiana), index=nombres, columns=nombres),
+            'activas': activas, 'excluidas': excluidas, 'no_estimables': variables['No estimable'].dropna(),
+            'objetivo': objetivo, 'categorias': categorias, 'iteraciones': iteracion,
+            'observaciones': observaciones, 'log_verosimilitud': log_verosimilitud}
+
+
+def RazonesMomios(modelo, nivel=0.95):
+    """ Razones de momios ajustadas con su intervalo de confianza y p-valor.
+        Las variables no estimables aparecen con valores faltantes y el
+        motivo en la columna 'No estimable', que indica también si los
+        registros de la categoría se excluyeron del ajuste."""
+
+    coeficientes = modelo['coeficientes'].drop('Intercepto')
+    errores = np.sqrt(np.diag(modelo['covarianza']))[1:]
+    z = stats.norm.ppf(0.5 + nivel / 2)
+    razones = pd.DataFrame({'Razon de momios': np.exp(coeficientes),
+                            'Inferior': np.exp(coeficientes - z * errores),
+                            'Superior': np.exp(coeficientes + z * errores),
+                            'p-valor': 2 * stats.norm.sf(np.abs(coeficientes / errores))})
+    nombres = [nombre for nombre in NombresVariables(modelo['categorias']) if nombre != 'Intercepto']
+    return razones.reindex(nombres).assign(**{'No estimable': modelo['no_estimables']})
+
+
+def Puntuar(modelo, casos):
+    """ Probabilidad estimada del objetivo para cada caso de un DataFrame.
+        Los casos de categorías excluidas del ajuste quedan como NaN."""
+
+    X = MatrizDisenio(casos, modelo['categorias'])
+    probabilidad = special.expit(X[:, modelo['activas']] @ modelo['coeficientes'].values)
+    probabilidad[X[:, modelo['excluidas']].any(axis=1)] = np.nan
+    return probabilidad
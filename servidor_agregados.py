@@ -0,0 +1,192 @@
+# coding: utf-8
+""" Servidor HTTP local de los agregados del análisis.
+
+    Sirve como JSON o CSV los agregados de la versión más reciente guardada en
+    el almacén columnar (ver almacen_columnar). Las respuestas se generan una
+    sola vez por versión y se guardan en memoria con su ETag; cuando aparece
+    una nueva versión en el almacén se calculan sus agregados en segundo plano
+    y se reemplazan todas las respuestas a la vez.
+
+    Uso:
+        python servidor_agregados.py almacen --puerto 8020
+
+    Rutas: /, /totales, /distribuciones, /series_ingreso, /series_sintomas, /series_defuncion,
+    /confirmados_estados, /matriz_estados y /comorbilidad. Se agrega la
+    extensión .csv para obtener CSV en lugar de JSON."""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import traceback
+from datetime import date
+from urllib.parse import urlsplit
+
+from agregados import CalcularAgregados, Entidades, Instituciones, PoblacionEntidades, PrepararCasos
+from almacen_columnar import AbrirAlmacen, LeerAlmacen, Versiones, archivo_metadatos
+
+tipos_contenido = {'json': 'application/json; charset=utf-8', 'csv': 'text/csv; charset=utf-8'}
+estados_http = {200: 'OK', 304: 'Not Modified', 404: 'Not Found', 405: 'Method Not Allowed',
+                503: 'Service Unavailable'}
+
+
+def _Cuerpo(cuerpo):
+    return cuerpo, '"' + hashlib.sha1(cuerpo).hexdigest() + '"'
+
+
+def Rollups(agregados, version):
+    """ Serializa cada agregado como JSON y CSV. Regresa un diccionario de ruta
+        a {formato: (cuerpo, etag)}."""
+
+    rollups = {}
+    for nombre, tabla in agregados.items():
+        tabla = tabla.reset_index() if any(tabla.index.names) else tabla
+        rollups['/' + nombre] = {
+            'json': _Cuerpo(tabla.to_json(orient='records', date_format='iso', force_ascii=False).encode('utf-8')),
+            'csv': _Cuerpo(tabla.to_csv(index=False).encode('utf-8'))}
+    indice = {'version': version, 'rutas': sorted(rollups)}
+    rollups['/'] = {'json': _Cuerpo(json.dumps(indice, ensure_ascii=False).encode('utf-8'))}
+    return rollups
+
+
+def CargarVersion(directorio, entidades, poblacion_entidades, instituciones=None):
+    """ Lee una versión del almacén y calcula sus agregados y respuestas."""
+
+    almacen = AbrirAlmacen(directorio)
+    casos_totales = PrepararCasos(LeerAlmacen(almacen))
+    fecha_actualizacion = date.fromisoformat(almacen['fecha_actualizacion'])
+    agregados = CalcularAgregados(casos_totales, entidades, poblacion_entidades, fecha_actualizacion,
+                                  instituciones=instituciones)
+    return Rollups(agregados, almacen['fecha_actualizacion'])
+
+
+def _Respuesta(codigo, cuerpo=b'', encabezados=None, incluir_cuerpo=True):
+    lineas = [f'HTTP/1.1 {codigo} {estados_http[codigo]}', f'Content-Length: {len(cuerpo)}']
+    lineas += [f'{nombre}: {valor}' for nombre, valor in (encabezados or {}).items()]
+    return ('\r\n'.join(lineas) + '\r\n\r\n').encode('latin-1') + (cuerpo if incluir_cuerpo else b'')
+
+
+def Responder(metodo, objetivo, encabezados, vigente):
+    """ Genera la respuesta HTTP completa para una solicitud."""
+
+    if metodo not in ('GET', 'HEAD'):
+        return _Respuesta(405, encabezados={'Allow': 'GET, HEAD'})
+    if vigente is None:
+        return _Respuesta(503, b'Sin versiones procesadas', {'Retry-After': '60'})
+    version, rollups = vigente
+
+    ruta = urlsplit(objetivo).path
+    ruta, extension = os.path.splitext(ruta)
+    formato = extension.lstrip('.') or 'json'
+    cuerpo, etag = rollups.get(ruta if ruta != '' else '/', {}).get(formato, (None, None))
+    if cuerpo is None:
+        return _Respuesta(404, b'Ruta inexistente')
+
+    encabezados_respuesta = {'Content-Type': tipos_contenido[formato], 'ETag': etag,
+                             'Cache-Control': 'no-cache', 'X-Version': version}
+    if etag in [e.strip() for e in encabezados.get('if-none-match', '').split(',')]:
+        return _Respuesta(304, encabezados={'ETag': etag, 'X-Version': version}, incluir_cuerpo=False)
+    return _Respuesta(200, cuerpo, encabezados_respuesta, incluir_cuerpo=metodo == 'GET')
+
+
+async def _Atender(lector, escritor, estado):
+    try:
+        while True:
+            linea = await lector.readline()
+            if not linea.strip():
+                break
+            metodo, objetivo, _ = linea.decode('latin-1').split(' ', 2)
+            encabezados = {}
+            while True:
+                encabezado = await lector.readline()
+                if encabezado in (b'\r\n', b'\n', b''):
+                    break
+                nombre, _, valor = encabezado.decode('latin-1').partition(':')
+                encabezados[nombre.strip().lower()] = valor.strip()
+
+            escritor.write(Responder(metodo, objetivo, encabezados, estado['vigente']))
+            await escritor.drain()
+            if encabezados.get('connection', '').lower() == 'close':
+                break
+    except (ConnectionError, ValueError):
+        pass
+    finally:
+        escritor.close()
+
+
+def _Clave(raiz, version):
+    """ Identifica el contenido de una versión por su nombre y la fecha de
+        modificación de sus metadatos, que cambia si la versión se reconstruye."""
+
+    try:
+        return version, os.stat(os.path.join(raiz, version, archivo_metadatos)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+async def _Vigilar(raiz, estado, intervalo, entidades, poblacion_entidades, instituciones):
+    """ Revisa periódicamente si hay una versión nueva o reconstruida en el
+        almacén. Los agregados se calculan en otro hilo y la versión vigente
+        se reemplaza con una sola asignación, por lo que cada solicitud ve una
+        versión completa. Si una versión no se puede cargar se sigue sirviendo
+        la vigente y la versión se anota en estado['fallidas'] con la clave de
+        sus metadatos, para no volver a intentarla en cada revisión mientras
+        no cambie."""
+
+    bucle = asyncio.get_running_loop()
+    while True:
+        claves = [_Clave(raiz, version) for version in Versiones(raiz)]
+        claves = [clave for clave in claves if clave is not None]
+        for version in list(estado['fallidas']):
+            if (version, estado['fallidas'][version]) not in claves:
+                del estado['fallidas'][version]
+        claves = [clave for clave in claves if estado['fallidas'].get(clave[0]) != clave[1]]
+
+        # Mientras se reemplaza una versión reconstruida no aparece en el almacén; no se regresa a una anterior
+        if claves and claves[-1] != estado['clave_vigente'] and \
+                (estado['clave_vigente'] is None or claves[-1][0] >= estado['clave_vigente'][0]):
+            version = claves[-1][0]
+            try:
+                rollups = await bucle.run_in_executor(None, CargarVersion, os.path.join(raiz, version),
+                                                      entidades, poblacion_entidades, instituciones)
+            except Exception:
+                estado['fallidas'][version] = claves[-1][1]
+                print('No se pudo cargar la versión', version, file=sys.stderr)
+                traceback.print_exc()
+            else:
+                estado['vigente'], estado['clave_vigente'] = (version, rollups), claves[-1]
+                print('Versión vigente:', version)
+        await asyncio.sleep(intervalo)
+
+
+async def Servir(raiz, host='127.0.0.1', puerto=8020, intervalo=60,
+                 ruta_catalogos='Catalogos_0412.xlsx', ruta_poblacion='pob_ini_proyecciones.csv'):
+    """ Inicia el servidor y la revisión periódica del almacén."""
+
+    estado = {'vigente': None, 'clave_vigente': None, 'fallidas': {}}
+    entidades = Entidades(ruta_catalogos)
+    poblacion_entidades = PoblacionEntidades(ruta_poblacion)
+    instituciones = Instituciones(ruta_catalogos)
+
+    servidor = await asyncio.start_server(lambda l, e: _Atender(l, e, estado), host, puerto)
+    vigilancia = asyncio.create_task(_Vigilar(raiz, estado, intervalo, entidades, poblacion_entidades,
+                                            instituciones))
+    print(f'Sirviendo en http://{host}:{puerto}/')
+    async with servidor:
+        await asyncio.gather(servidor.serve_forever(), vigilancia)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Servidor local de agregados de COVID-19.')
+    parser.add_argument('raiz', help='Directorio raíz del almacén columnar')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--puerto', type=int, default=8020)
+    parser.add_argument('--intervalo', type=float, default=60, help='Segundos entre revisiones del almacén')
+    parser.add_argument('--catalogos', default='Catalogos_0412.xlsx')
+    parser.add_argument('--poblacion', default='pob_ini_proyecciones.csv')
+    argumentos = parser.parse_args()
+
+    asyncio.run(Servir(argumentos.raiz, argumentos.host, argumentos.puerto, argumentos.intervalo,
+                       argumentos.catalogos, argumentos.poblacion))
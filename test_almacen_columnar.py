@@ -0,0 +1,56 @@
+# coding: utf-8
+""" Pruebas de la construcción y la búsqueda de registros del almacén columnar."""
+
+import os
+import zipfile
+
+import pytest
+
+from almacen_columnar import AbrirAlmacen, BuscarRegistros, ConstruirAlmacen, ValoresRegistro, Versiones
+
+csv_prueba = ('FECHA_ACTUALIZACION,ID_REGISTRO,EDAD,FECHA_INGRESO\n'
+              '2020-04-29,09e8dc,34,2020-04-20\n'
+              '2020-04-29,1dd782,61,2020-04-22\n'
+              '2020-04-29,0a1b2c,47,9999-99-99\n')
+
+
+def _Zip(ruta, contenido):
+    with zipfile.ZipFile(ruta, 'w') as archivo_zip:
+        archivo_zip.writestr('casos.csv', contenido)
+    return str(ruta)
+
+
+@pytest.fixture
+def almacen(tmp_path):
+    return AbrirAlmacen(ConstruirAlmacen(_Zip(tmp_path / 'casos.zip', csv_prueba), str(tmp_path / 'almacen')))
+
+
+def test_busca_en_el_orden_solicitado(almacen):
+    registros = BuscarRegistros(almacen, ['1dd782', '09e8dc'])
+    assert list(registros.index) == ['1dd782', '09e8dc']
+    assert list(registros['EDAD']) == [61, 34]
+
+
+def test_id_mas_largo_que_el_indice_no_se_trunca(almacen):
+    assert BuscarRegistros(almacen, ['09e8dcXX']).empty
+    assert list(BuscarRegistros(almacen, ['09e8dcXX', '1dd782']).index) == ['1dd782']
+    assert ValoresRegistro(almacen, '09e8dcXX') is None
+
+
+def test_valores_registro(almacen):
+    assert ValoresRegistro(almacen, '0a1b2c', ['EDAD'])['EDAD'] == 47
+    assert ValoresRegistro(almacen, 'ffffff') is None
+
+
+def test_reconstruir_version_la_reemplaza(tmp_path):
+    raiz = str(tmp_path / 'almacen')
+    ConstruirAlmacen(_Zip(tmp_path / 'casos.zip', csv_prueba), raiz)
+    abierto = AbrirAlmacen(os.path.join(raiz, '2020-04-29'))
+
+    corregido = csv_prueba.replace('1dd782,61', '1dd782,62')
+    destino = ConstruirAlmacen(_Zip(tmp_path / 'corregido.zip', corregido), raiz)
+    assert os.listdir(raiz) == ['2020-04-29']
+    assert Versiones(raiz) == ['2020-04-29']
+    assert ValoresRegistro(AbrirAlmacen(destino), '1dd782', ['EDAD'])['EDAD'] == 62
+    # Un almacén abierto antes del reemplazo sigue leyendo sus propios datos
+    assert ValoresRegistro(abierto, '1dd782', ['EDAD'])['EDAD'] == 61
@@ -0,0 +1,54 @@
+# coding: utf-8
+""" Pruebas del barrido de umbrales del ranking de entidades."""
+
+import numpy as np
+import pandas as pd
+
+from escenarios_ranking import (BarridoRanking, IndicadoresRanking, RejillaUmbrales, letalidad_mundial,
+                                umbrales_base)
+
+# Valores en ambos lados de cada umbral base, incluyendo los límites exactos
+indicadores_prueba = pd.DataFrame({
+    'Casos': [10, 500, 120, 3000, 45, 800],
+    'Incidencia': [20.0, 50.0, 50.1, 200.0, 200.1, 120.0],
+    'Letalidad': [0.0, letalidad_mundial, letalidad_mundial * 1.5, letalidad_mundial * 2, 0.3, np.nan],
+    'Razon periodo': [1.2, 1.41, 1.5, 2.0, 2.5, 1.0],
+    'Razon maximo': [1.0, 1.0, 1.0, 0.71, 0.5, 0.3]},
+    index=[1, 2, 3, 4, 5, 6])
+
+
+def _Clases(fila):
+    """ Reglas de matriz_estados e IndiceCrecimiento del análisis, caso por caso."""
+
+    incidencia = 2 if fila['Incidencia'] > 200 else 1 if fila['Incidencia'] > 50 else 0
+    letalidad = fila['Letalidad'] if fila['Letalidad'] == fila['Letalidad'] else 0
+    letalidad = 2 if letalidad > letalidad_mundial * 2 else 1 if letalidad > letalidad_mundial else 0
+    if fila['Razon maximo'] == 1:
+        tendencia = 4 if fila['Razon periodo'] > 2 else 3 if fila['Razon periodo'] > 1.41 else 2
+    else:
+        tendencia = 0 if fila['Razon maximo'] < 0.5 else 1 if fila['Razon maximo'] < 0.71 else 2
+    return incidencia, letalidad, tendencia
+
+
+def test_umbrales_base_reproducen_matriz_estados():
+    clases = IndicadoresRanking(indicadores_prueba, RejillaUmbrales())
+    esperadas = np.array([_Clases(fila) for _, fila in indicadores_prueba.iterrows()])
+    assert (clases['Incidencia'][0] == esperadas[:, 0]).all()
+    assert (clases['Letalidad'][0] == esperadas[:, 1]).all()
+    assert (clases['Tendencia'][0] == esperadas[:, 2]).all()
+
+    lugar_casos = indicadores_prueba['Casos'].rank().values
+    puntaje = lugar_casos / lugar_casos.max() + esperadas.sum(axis=1)
+    assert np.allclose(clases['Ranking'][0], puntaje)
+
+    lugares = BarridoRanking(indicadores_prueba, RejillaUmbrales())
+    esperados = pd.Series(puntaje, index=indicadores_prueba.index).rank(ascending=False, method='first')
+    assert list(lugares.iloc[0]) == list(esperados.astype(int))
+
+
+def test_escenario_base_dentro_de_la_rejilla():
+    rejilla = RejillaUmbrales(incidencia_media=[25, 50, 75], alza_importante=[1.75, 2, 2.25])
+    base = (rejilla[list(umbrales_base)] == pd.Series(umbrales_base)).all(axis=1)
+    assert base.sum() == 1
+    lugares = BarridoRanking(indicadores_prueba, rejilla)
+    assert (lugares[base].values == BarridoRanking(indicadores_prueba, RejillaUmbrales()).values).all()
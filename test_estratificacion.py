@@ -0,0 +1,46 @@
+# coding: utf-8
+""" Pruebas del tensor de conteos estratificados."""
+
+import pandas as pd
+import pytest
+
+from estratificacion import Marginal, TensorConteos
+
+datos_prueba = pd.DataFrame({'EDAD': [5, 15, 15, 35, 70, 70, 70],
+                             'SEXO': [1, 2, 2, 1, 2, 1, 2],
+                             'RESULTADO': [1, 1, 2, 1, 1, 3, 1]})
+ejes_prueba = {'EDAD': {'bordes': [0, 10, 20]},
+               'SEXO': {'categorias': [2, 1], 'etiquetas': ['Hombres', 'Mujeres']},
+               'RESULTADO': {'categorias': [1, 2, 3]}}
+
+
+@pytest.mark.parametrize('disperso', [False, True])
+def test_marginal_de_dos_ejes_en_el_orden_indicado(disperso):
+    conteos, etiquetas = TensorConteos(datos_prueba, ejes_prueba, disperso=disperso)
+    esperado = datos_prueba.assign(EDAD=pd.cut(datos_prueba['EDAD'], [0, 10, 20, 200], right=False,
+                                               labels=['0-9', '10-19', '20+']).astype(str),
+                                   SEXO=datos_prueba['SEXO'].map({2: 'Hombres', 1: 'Mujeres'}))
+
+    sexo_edad = Marginal(conteos, etiquetas, ['SEXO', 'EDAD'])
+    assert list(sexo_edad.index.names) == ['SEXO', 'EDAD']
+    assert sexo_edad.to_dict() == {clave: (esperado[['SEXO', 'EDAD']].apply(tuple, axis=1) == clave).sum()
+                                   for clave in sexo_edad.index}
+
+    edad_sexo = Marginal(conteos, etiquetas, ['EDAD', 'SEXO'], {'RESULTADO': 1})
+    assert list(edad_sexo.index.names) == ['EDAD', 'SEXO']
+    assert edad_sexo[('20+', 'Hombres')] == 2
+    assert edad_sexo[('20+', 'Mujeres')] == 1
+    assert edad_sexo.sum() == (datos_prueba['RESULTADO'] == 1).sum()
+
+
+def test_valores_fuera_de_categoria():
+    datos = datos_prueba.assign(EDAD=[5, 15, -1, 35, 70, None, 70], SEXO=[1, 2, 2, 99, 2, 1, 2])
+    with pytest.warns(UserWarning, match='3 registros'):
+        conteos, etiquetas = TensorConteos(datos, ejes_prueba)
+    assert conteos.sum() == len(datos) - 3
+
+    ejes = {nombre: dict(eje, otros='Otros') for nombre, eje in ejes_prueba.items()}
+    conteos, etiquetas = TensorConteos(datos, ejes, disperso=True)
+    assert Marginal(conteos, etiquetas, 'RESULTADO')[[1, 2, 3]].sum() == len(datos)
+    assert Marginal(conteos, etiquetas, 'EDAD')['Otros'] == 2
+    assert Marginal(conteos, etiquetas, 'SEXO')['Otros'] == 1
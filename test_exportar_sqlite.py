@@ -0,0 +1,51 @@
+# coding: utf-8
+""" Pruebas de la exportación de agregados a SQLite."""
+
+import pandas as pd
+
+from agregados import atributos_comorbilidad
+from exportar_sqlite import Conectar, ExportarAgregados
+
+
+def _Agregados(dias, entidades):
+    """ Agregados mínimos con el formato de CalcularAgregados."""
+
+    fechas = pd.date_range('2020-04-20', periods=dias, name='FECHA')
+    serie = pd.DataFrame({'Estudiados': 10, 'Confirmados': 4, 'Hospitalizados confirmados': 2,
+                          'Defunciones confirmadas': 1}, index=fechas)
+    return {'totales': pd.DataFrame({'Casos': [4, 5, 1, 1]},
+                                    index=pd.Index(['Positivos', 'Negativos', 'Pendientes',
+                                                    'Defunciones confirmadas'], name='Estado')),
+            'distribuciones': pd.DataFrame({'Casos': [3, 1]},
+                                           index=pd.MultiIndex.from_tuples([('Sexo', 'Hombres'), ('Sexo', 'Mujeres')],
+                                                                           names=['Grafica', 'Categoria'])),
+            'series_ingreso': serie, 'series_sintomas': serie, 'series_defuncion': serie,
+            'confirmados_estados': pd.DataFrame({'ENTIDAD_UM': list(range(1, len(entidades) + 1)),
+                                                 'ENTIDAD': entidades, 'FECHA_SINTOMAS': fechas[0], 'Casos': 2}),
+            'matriz_estados': pd.DataFrame({'Lugar en casos': 1, 'Incidencia': 'Baja', 'Letalidad': 'Baja',
+                                            'Tendencia': 'Estable', 'Ranking': 1.0, 'Casos': 2,
+                                            'Casos por millon': 0.5, 'Tasa de letalidad': 0.0},
+                                           index=pd.Index(entidades, name='ENTIDAD')),
+            'comorbilidad': pd.DataFrame({'Ambulatorios': 0.1, 'Defunciones': 0.3},
+                                         index=pd.Index(atributos_comorbilidad, name='Comorbilidad'))}
+
+
+def _Filas(conexion, tabla, version):
+    return conexion.execute(f'SELECT COUNT(*) FROM {tabla} WHERE version = ?', (version,)).fetchone()[0]
+
+
+def test_reexportar_elimina_filas_que_ya_no_se_producen(tmp_path):
+    conexion = Conectar(str(tmp_path / 'agregados.sqlite'))
+    ExportarAgregados(conexion, '2020-04-28', _Agregados(5, ['Aguascalientes', 'Baja California']), 100)
+    ExportarAgregados(conexion, '2020-04-29', _Agregados(5, ['Aguascalientes', 'Baja California']), 100)
+
+    ExportarAgregados(conexion, '2020-04-29', _Agregados(3, ['Aguascalientes']), 90)
+    assert _Filas(conexion, 'series_diarias', '2020-04-29') == 3 * 3
+    assert _Filas(conexion, 'confirmados_estados', '2020-04-29') == 1
+    assert [entidad for entidad, in conexion.execute('SELECT entidad FROM matriz_estados WHERE version = ?',
+                                                      ('2020-04-29',))] == ['Aguascalientes']
+    assert conexion.execute('SELECT registros FROM versiones WHERE version = ?', ('2020-04-29',)).fetchone() == (90,)
+    # Las demás versiones no cambian
+    assert _Filas(conexion, 'series_diarias', '2020-04-28') == 5 * 3
+    assert _Filas(conexion, 'matriz_estados', '2020-04-28') == 2
+    conexion.close()